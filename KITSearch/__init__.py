@@ -2,3 +2,5 @@
  DOC STRING!!!1111
 """
 from .kitsearch import KITSearch
+from .kitcache import KITCache, KITLRU
+from .kitprofile import KITQueryLog
@@ -0,0 +1,138 @@
+""" Benchmark of the KITSearch query paths.
+
+    Runs the probe_search_* and ali_search_* methods against a database
+    (by default a fresh kitmock stand-in) and reports latency, throughput
+    and the number of queries per call.
+
+    python -m KITSearch.kitbench --sensors 20 --points 5000 --workers 4
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+try:
+    from .kitsearch import KITSearch
+    from .kitmock import createMockDB
+except:
+    from kitsearch import KITSearch
+    from kitmock import createMockDB
+
+
+def benchmark(cred, repeat=3, workers=4, out=sys.stdout):
+    """ Time all search paths of KITSearch
+
+        Args:
+            cred (dict): credentials of KITSearch, e.g. {"url" : ...}
+            repeat (int): repetitions per case, the best one is reported
+            workers (int): threads used by the concurrent cases
+            out (None|file): where the result table is printed
+
+        Returns:
+            list: one dict per case with name, seconds, calls, queries and
+                  rows (data points) as well as rows per second
+    """
+    search = KITSearch(cred, profile=True, workers=workers)
+
+    PIDs = search.probe_find_PIDs()
+    runs = [rec["run"] for rec in search.ali_iter_catalog()]
+    names = []
+    for rec in search.probe_iter_catalog():
+        if (rec["name"], rec["project"]) not in names:
+            names.append((rec["name"], rec["project"]))
+
+    # number of data points of a result, metadata only cases count none
+    count = lambda dic: sum(len(sub["dataX"]) for sub in dic.values())
+    def each(func, items):
+        for item in items:
+            func(*item)
+        return 0
+    cases = [
+        ("probe_search_for_PID", len(PIDs),
+         lambda: sum(len(search.probe_search_for_PID(PID)["dataX"])
+                     for PID in PIDs)),
+        ("probe_search_for_PIDs", 1,
+         lambda: count(search.probe_search_for_PIDs(PIDs, workers=1))),
+        ("probe_search_for_PIDs (workers=%i)" % workers, 1,
+         lambda: count(search.probe_search_for_PIDs(PIDs))),
+        ("probe_search_for_name", len(names),
+         lambda: sum(count(search.probe_search_for_name(name, project))
+                     for (name, project) in names)),
+        ("probe_search_for_project", 1,
+         lambda: count(search.probe_search_for_project())),
+        ("probe_stream_data", len(PIDs),
+         lambda: sum(len(search.probe_stream_data(PID)["dataX"])
+                     for PID in PIDs)),
+        ("probe_search_for_info", len(PIDs),
+         lambda: each(search.probe_search_for_info, [(PID,) for PID in PIDs])),
+        ("probe_catalog", 1,
+         lambda: each(len, [(list(search.probe_iter_catalog()),)])),
+        ("ali_search_for_run", len(runs),
+         lambda: each(search.ali_search_for_run, [(run,) for run in runs])),
+        ("ali_search_for_runs (workers=%i)" % workers, 1,
+         lambda: each(search.ali_search_for_runs, [(runs,)])),
+        ("ali_search_for_name_voltage", len(names),
+         lambda: each(search.ali_search_for_name_voltage,
+                      [(name, 500, project) for (name, project) in names])),
+        ("ali_search_for_name_annealing", len(names),
+         lambda: each(search.ali_search_for_name_annealing,
+                      [(name, 30, project) for (name, project) in names]))]
+
+    results = []
+    for name, calls, func in cases:
+        best = None
+        for i in range(repeat):
+            # measure the database, not the in-memory lookups
+            search.lru.invalidate()
+            search.resetStats()
+            t0 = time.perf_counter()
+            rows = func()
+            seconds = time.perf_counter() - t0
+            if best is None or seconds < best["seconds"]:
+                best = {"name"    : name,
+                        "seconds" : seconds,
+                        "calls"   : calls,
+                        "queries" : search.stats()["total"]["queries"],
+                        "rows"    : rows,
+                        "rows/s"  : rows / seconds if seconds > 0 else 0.}
+        results.append(best)
+
+    if out is not None:
+        out.write("{:<38} {:>10} {:>10} {:>8} {:>10} {:>12}\n".format(
+            "case", "total [s]", "call [ms]", "queries", "rows", "rows/s"))
+        for res in results:
+            out.write("{:<38} {:>10.4f} {:>10.3f} {:>8} {:>10} {:>12.0f}\n"
+                      .format(res["name"], res["seconds"],
+                              1e3 * res["seconds"] / max(1, res["calls"]),
+                              res["queries"], res["rows"], res["rows/s"]))
+
+    search.log.close()
+    search.engine.dispose()
+    return results
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Benchmark KITSearch "
+                                     "against an SQLite stand-in of the IEKP "
+                                     "database")
+    parser.add_argument("--db", default=None,
+                        help="existing SQLAlchemy URL instead of a stand-in")
+    parser.add_argument("--sensors", type=int, default=10)
+    parser.add_argument("--pids", type=int, default=5)
+    parser.add_argument("--points", type=int, default=1000)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    url = args.db
+    if url is None:
+        path = os.path.join(tempfile.gettempdir(), "kitmock.db")
+        t0 = time.perf_counter()
+        url = createMockDB(path, sensors=args.sensors, pids=args.pids,
+                           points=args.points, runs=args.runs)
+        print("Stand-in database %s built in %.2f s"
+              %(path, time.perf_counter() - t0))
+
+    benchmark({"url" : url}, repeat=args.repeat, workers=args.workers)
@@ -0,0 +1,178 @@
+import os
+import time
+import pickle
+import sqlite3
+import threading
+from collections import OrderedDict
+
+
+class KITCache(object):
+    """ Persistent read-through cache for KITSearch results.
+
+    Results are pickled into a local SQLite file and keyed by kind ("probe",
+    "alibava") and PID/run. Every entry carries a validation token built from
+    database hints (e.g. probe.date and the number of data rows) and a flag
+    that tells whether the measurement is closed and will not change anymore.
+
+    """
+
+    def __init__(self, path="kitsearch_cache.db"):
+        """ Open or create the cache file
+
+        Args:
+            path (str): location of the SQLite cache file
+
+        """
+        self.path = path
+        self.__lock = threading.Lock()
+        self.__cnx = sqlite3.connect(path, check_same_thread=False)
+        self.__cnx.execute("CREATE TABLE IF NOT EXISTS entries ("
+                           "kind TEXT, key INTEGER, token TEXT, "
+                           "final INTEGER, stored REAL, size INTEGER, "
+                           "data BLOB, PRIMARY KEY (kind, key))")
+        self.__cnx.commit()
+
+    def get(self, kind, key):
+        """ Returns (token, final, result) of an entry or None
+        """
+        with self.__lock:
+            row = self.__cnx.execute("SELECT token, final, data FROM entries "
+                                     "WHERE kind=? AND key=?",
+                                     (kind, int(key))).fetchone()
+        if row is None:
+            return None
+        return row[0], bool(row[1]), pickle.loads(row[2])
+
+    def put(self, kind, key, token, final, result):
+        """ Store a result together with its validation token
+
+        Args:
+            kind (str): "probe" or "alibava"
+            key (int): PID or run
+            token (str): validation token derived from database hints
+            final (bool): measurement is closed and will not change
+            result (dict): result of the KITSearch method
+
+        """
+        data = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        with self.__lock:
+            self.__cnx.execute("INSERT OR REPLACE INTO entries VALUES "
+                               "(?, ?, ?, ?, ?, ?, ?)",
+                               (kind, int(key), token, int(final), time.time(),
+                                len(data), sqlite3.Binary(data)))
+            self.__cnx.commit()
+
+    def keys(self, kind="probe"):
+        """ Returns all cached PIDs/runs of a kind
+        """
+        with self.__lock:
+            rows = self.__cnx.execute("SELECT key FROM entries WHERE kind=? "
+                                      "ORDER BY key", (kind,)).fetchall()
+        return [row[0] for row in rows]
+
+    def info(self):
+        """ Returns number of entries and bytes per kind and the file size
+        """
+        with self.__lock:
+            rows = self.__cnx.execute("SELECT kind, COUNT(*), SUM(size), "
+                                      "SUM(final) FROM entries "
+                                      "GROUP BY kind").fetchall()
+        dic = {"path" : self.path,
+               "file_size" : os.path.getsize(self.path)}
+        for kind, count, size, final in rows:
+            dic[kind] = {"entries" : count,
+                         "bytes" : size,
+                         "final" : final}
+        return dic
+
+    def purge(self, kind=None, key=None):
+        """ Remove entries. Without arguments the whole cache is cleared.
+
+        Args:
+            kind (None|str): only remove entries of this kind
+            key (None|int): only remove this PID/run
+
+        Returns:
+            number of removed entries
+
+        """
+        query = "DELETE FROM entries"
+        args = []
+        if kind is not None:
+            query += " WHERE kind=?"
+            args.append(kind)
+            if key is not None:
+                query += " AND key=?"
+                args.append(int(key))
+        with self.__lock:
+            count = self.__cnx.execute(query, args).rowcount
+            self.__cnx.commit()
+            if kind is None:
+                self.__cnx.execute("VACUUM")
+        return count
+
+    def close(self):
+        self.__cnx.close()
+
+
+class KITLRU(object):
+    """ Bounded in-memory LRU cache with time-to-live and hit/miss counters.
+
+    Used by KITSearch for lookups that rarely change, like sensor info,
+    annealing and irradiation histories.
+
+    """
+
+    def __init__(self, maxsize=1024, ttl=600):
+        """
+        Args:
+            maxsize (int): maximum number of entries
+            ttl (None|float): seconds after which an entry expires
+
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def lookup(self, key, fetch):
+        """ Returns the cached value of key or calls fetch() on a miss and
+            stores its result
+        """
+        now = time.time()
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None and (entry[0] is None or entry[0] > now):
+                self.__entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        value = fetch()
+        expires = None if self.ttl is None else now + self.ttl
+
+        with self.__lock:
+            self.__entries[key] = (expires, value)
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.maxsize:
+                self.__entries.popitem(last=False)
+        return value
+
+    def invalidate(self, key=None):
+        """ Remove a single key or (without key) all entries
+        """
+        with self.__lock:
+            if key is None:
+                self.__entries.clear()
+            else:
+                self.__entries.pop(key, None)
+
+    def stats(self):
+        with self.__lock:
+            return {"hits"    : self.hits,
+                    "misses"  : self.misses,
+                    "size"    : len(self.__entries),
+                    "maxsize" : self.maxsize,
+                    "ttl"     : self.ttl}
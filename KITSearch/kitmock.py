@@ -0,0 +1,139 @@
+""" SQLite stand-in of the IEKP database for offline tests and benchmarks.
+
+    The tables are created from the db_map models and filled with synthetic
+    sensors, probe station measurements, ALiBaVa runs, annealing steps and
+    irradiations. Connect to it with KITSearch({"url" : url}).
+"""
+import os
+import random
+import datetime
+import sqlalchemy
+from sqlalchemy import insert
+try:
+    from .db_map import *
+except:
+    from db_map import *
+
+
+def createMockDB(path="kitmock.db", sensors=10, pids=5, points=1000, runs=20,
+                 annealings=4, irradiations=2, projects=2, seed=1,
+                 chunksize=10000):
+    """ Build (or rebuild) an SQLite database with the IEKP schema
+
+        Args:
+            path (str): location of the SQLite file, an existing file is
+                replaced
+            sensors (int): number of sensors in the info table
+            pids (int): probe station measurements per sensor
+            points (int): probe_data rows per measurement
+            runs (int): ALiBaVa runs per sensor
+            annealings (int): annealing steps per sensor
+            irradiations (int): irradiations per sensor
+            projects (int): number of projects the sensors are spread over
+            seed (int): seed of the random numbers
+            chunksize (int): rows per insert statement
+
+        Returns:
+            str: SQLAlchemy URL of the database
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    url = "sqlite:///" + os.path.abspath(path)
+    engine = sqlalchemy.create_engine(url)
+    Base.metadata.create_all(engine)
+
+    rnd = random.Random(seed)
+    start = datetime.datetime(2017, 1, 1)
+    day = datetime.timedelta(days=1)
+    quantities = ["I_tot", "C_tot", "R_int", "I_leak_dc"]
+
+    info = []
+    irradiation = []
+    annealing = []
+    probe = []
+    alibava = []
+    PID = 0
+    run = 0
+
+    for ID in range(1, sensors + 1):
+        info.append({"ID"            : ID,
+                     "name"          : "Mock_%04i" % ID,
+                     "project"       : "Project_%i" % (ID % projects),
+                     "F_p_aim_n_cm2" : 1e15 * rnd.randint(0, 3),
+                     "F_n_aim_n_cm2" : 1e15 * rnd.randint(0, 3)})
+
+        # irradiations first, then annealing steps, measurements in between
+        for i in range(irradiations):
+            irradiation.append({"ID"           : ID,
+                                "F_n_cm2"      : 1e14 * rnd.randint(1, 10),
+                                "particletype" : rnd.choice(["n", "p"]),
+                                "date"         : start + (5 + i) * day})
+        for i in range(annealings):
+            annealing.append({"ID"          : ID,
+                              "date"        : start + (30 + 20 * i) * day,
+                              "temperature" : 60.,
+                              "time"        : 10.,
+                              "equiv"       : 10. * 2**i})
+
+        for i in range(pids):
+            PID += 1
+            probe.append({"probeid"     : PID,
+                          "ID"          : ID,
+                          "paraX"       : "Voltage",
+                          "paraY"       : quantities[i % len(quantities)],
+                          "date"        : start + (20 + 10 * i) * day,
+                          "temperature" : 20. + rnd.random(),
+                          "RH"          : 30. + rnd.random(),
+                          "station"     : 1 + i % 3,
+                          "flag"        : "meas" if i == pids - 1 else "good"})
+
+        for i in range(runs):
+            run += 1
+            date = start + (25 + 5 * i) * day
+            alibava.append({"alibava_uid"        : run,
+                            "run"                : run,
+                            "ID"                 : ID,
+                            "date"               : date,
+                            "voltage"            : -100. * (1 + i % 10),
+                            "electron_sig"       : 2e4 * rnd.random(),
+                            "signal_e_err"       : 100. * rnd.random(),
+                            "gain"               : 200. + rnd.random(),
+                            "SeedSigENC_MPV"     : 2e4 * rnd.random(),
+                            "SeedSigENC_MPV_err" : 100. * rnd.random(),
+                            "SeedSig_MPV"        : 100. * rnd.random(),
+                            "SeedSig_MPV_err"    : rnd.random(),
+                            "flag"               : "good",
+                            "last_analyzed"      : date + day})
+
+    with engine.begin() as conn:
+        for table, rows in [(db_info, info), (db_irradiation, irradiation),
+                            (db_annealing, annealing), (db_probe, probe),
+                            (db_alibava, alibava)]:
+            if len(rows) != 0:
+                conn.execute(insert(table), rows)
+
+        # probe data: voltage ramp with a noisy current
+        rows = []
+        uid = 0
+        for meas in probe:
+            for i in range(points):
+                uid += 1
+                rows.append({"probe_uid"    : uid,
+                             "probeid"      : meas["probeid"],
+                             "datax"        : -1000. * i / max(1, points - 1),
+                             "datay"        : -1e-9 * (i + rnd.random()),
+                             "dataz"        : 0.,
+                             "temperature"  : meas["temperature"],
+                             "RH"           : meas["RH"],
+                             "errory"       : 1e-11,
+                             "time"         : meas["date"]
+                                              + datetime.timedelta(seconds=i),
+                             "bias_current" : -1e-9 * i})
+                if len(rows) == chunksize:
+                    conn.execute(insert(db_probe_data), rows)
+                    rows = []
+        if len(rows) != 0:
+            conn.execute(insert(db_probe_data), rows)
+
+    engine.dispose()
+    return url
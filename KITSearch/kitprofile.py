@@ -0,0 +1,151 @@
+import sys
+import json
+import time
+import threading
+from contextlib import contextmanager
+from collections import OrderedDict, deque
+
+from sqlalchemy import event
+
+
+class KITQueryLog(object):
+    """ Records every query of an SQLAlchemy engine through the cursor
+    execute events.
+
+    For each query the SQL template, duration, number of rows and the
+    KITSearch method that issued it are kept. Queries that run inside
+    KITQueryLog.tag are also summed up per PID/run. Records can be written
+    to a JSON lines trace file.
+
+    """
+
+    def __init__(self, engine, trace=None, source=None, keep=1000):
+        """
+        Args:
+            engine: SQLAlchemy engine to instrument
+            trace (None|str): JSON lines file every query is appended to
+            source (None|str): file name of the module whose innermost
+                function is recorded as the calling method
+            keep (int): number of recent query records kept in memory
+
+        """
+        self.engine = engine
+        self.source = source
+        self.__trace = open(trace, "a") if trace is not None else None
+        self.__recent = deque(maxlen=keep)
+        self.__local = threading.local()
+        self.__lock = threading.Lock()
+        self.reset()
+
+        event.listen(engine, "before_cursor_execute", self.__before)
+        event.listen(engine, "after_cursor_execute", self.__after)
+
+    def __before(self, conn, cursor, statement, parameters, context,
+                 executemany):
+        conn.info.setdefault("kitprofile_start", []).append(
+            time.perf_counter())
+
+    def __after(self, conn, cursor, statement, parameters, context,
+                executemany):
+        seconds = time.perf_counter() - conn.info["kitprofile_start"].pop()
+        # Buffered cursors (default of mysqlconnector in SQLAlchemy) know the
+        # number of rows, others report -1 for results not fetched yet
+        rows = cursor.rowcount if cursor.rowcount >= 0 else None
+        method = self.__caller()
+        tags = list(getattr(self.__local, "tags", []))
+
+        record = OrderedDict([("time", time.time()),
+                              ("method", method),
+                              ("sql", statement),
+                              ("seconds", seconds),
+                              ("rows", rows),
+                              ("tags", tags)])
+
+        with self.__lock:
+            self.__recent.append(record)
+            self.__add(self.__total, seconds, rows)
+            self.__add(self.__methods.setdefault(method, self.__empty()),
+                       seconds, rows)
+            # a query that serves several PIDs/runs is split evenly
+            for kind, keys in tags:
+                share = 1. / len(keys)
+                for key in keys:
+                    entry = self.__keys.setdefault(kind, {})\
+                        .setdefault(key, self.__empty())
+                    self.__add(entry, seconds * share,
+                               None if rows is None else rows * share,
+                               share)
+            if self.__trace is not None:
+                self.__trace.write(json.dumps(record, default=str) + "\n")
+                self.__trace.flush()
+
+    def __caller(self):
+        """ Innermost function of the source module on the call stack
+        """
+        if self.source is None:
+            return None
+        frame = sys._getframe(2)
+        while frame is not None:
+            code = frame.f_code
+            if code.co_filename == self.source:
+                # report nested functions and lambdas as their method
+                name = getattr(code, "co_qualname", code.co_name)
+                return name.split(".<locals>")[0]
+            frame = frame.f_back
+        return None
+
+    def __empty(self):
+        return {"queries" : 0, "seconds" : 0., "rows" : 0}
+
+    def __add(self, entry, seconds, rows, queries=1):
+        entry["queries"] += queries
+        entry["seconds"] += seconds
+        if rows is not None:
+            entry["rows"] += rows
+
+    @contextmanager
+    def tag(self, kind, keys):
+        """ Attribute all queries of this thread inside the with block to
+            the given PIDs/runs
+
+        Args:
+            kind (str): e.g. "PID" or "run"
+            keys (list): PIDs/runs
+
+        """
+        keys = [int(key) for key in keys]
+        tags = self.__local.__dict__.setdefault("tags", [])
+        if len(keys) != 0:
+            tags.append((kind, keys))
+        try:
+            yield
+        finally:
+            if len(keys) != 0:
+                tags.pop()
+
+    def stats(self):
+        """ Returns the number of queries, seconds and rows in total, per
+            method and per PID/run together with the most recent records
+        """
+        with self.__lock:
+            return {"total"   : dict(self.__total),
+                    "methods" : {method : dict(entry) for method, entry
+                                 in self.__methods.items()},
+                    "keys"    : {kind : {key : dict(entry) for key, entry
+                                         in entries.items()}
+                                 for kind, entries in self.__keys.items()},
+                    "recent"  : [dict(record) for record in self.__recent]}
+
+    def reset(self):
+        with self.__lock:
+            self.__total = self.__empty()
+            self.__methods = {}
+            self.__keys = {}
+            self.__recent.clear()
+
+    def close(self):
+        event.remove(self.engine, "before_cursor_execute", self.__before)
+        event.remove(self.engine, "after_cursor_execute", self.__after)
+        if self.__trace is not None:
+            self.__trace.close()
+            self.__trace = None
@@ -1,28 +1,93 @@
 import sys,os
+import bisect
+import numpy as np
 import sqlalchemy
 import mysql.connector
 try:
     from .db_map import *
+    from .kitcache import KITCache, KITLRU
+    from .kitprofile import KITQueryLog
 except:
     from db_map import *
-from sqlalchemy.orm import sessionmaker
+    from kitcache import KITCache, KITLRU
+    from kitprofile import KITQueryLog
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.orm import scoped_session, sessionmaker
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 
 
 class KITSearch(object):
 
-    def __init__(self,cred):
+    # Keys of the probe data dictionary, their probe_data column and dtype
+    __probe_data_columns = [("dataX",    "datax",         "float64"),
+                            ("dataY",    "datay",         "float64"),
+                            ("dataZ",    "dataz",         "float64"),
+                            ("temp",     "temperature",   "float64"),
+                            ("rh",       "RH",            "float64"),
+                            ("err",      "errory",        "float64"),
+                            ("time",     "time",          "datetime64[us]"),
+                            ("bias_cur", "bias_current",  "float64")]
+
+    # Columns of the alibava table that are returned by the sensor scans
+    __alibava_scan_columns = ["run", "voltage", "date", "electron_sig",
+                              "signal_e_err", "gain", "SeedSigENC_MPV",
+                              "SeedSigENC_MPV_err"]
+
+    # Columns of the alibava table that are needed for a single run
+    __alibava_run_columns = ["voltage", "electron_sig", "signal_e_err", "gain",
+                             "SeedSigENC_MPV", "SeedSigENC_MPV_err",
+                             "SeedSig_MPV", "SeedSig_MPV_err", "ID", "date",
+                             "flag", "last_analyzed"]
+
+    def __init__(self,cred,cache=None,validate=False,lru_size=1024,
+                 lru_ttl=600,workers=1,profile=False,trace=None):
         """ cred = {"host"      : "...",
                     "database"  : "...",
                     "user"      : "...",
                     "passwd"    : "..."}
+            or cred = {"url" : "..."} with any SQLAlchemy database URL, e.g.
+            an SQLite stand-in built by kitmock.createMockDB
+
+            cache (None|str|KITCache): local cache file for PID/run results
+            validate (True|False): also check cached closed measurements
+                against the database. Otherwise only measurements that were
+                still running ('meas' flag) are checked
+            lru_size (int): number of sensor info, annealing and irradiation
+                lookups that are kept in memory
+            lru_ttl (None|float): seconds until these lookups expire
+            workers (int): number of threads that fetch PIDs/runs
+                concurrently. The connection pool is sized accordingly.
+            profile (True|False): record every query (see stats)
+            trace (None|str): JSON lines file every query is written to.
+                Implies profile
         """
-        self.engine = sqlalchemy.create_engine("mysql+mysqlconnector://" +
-                                          cred["user"] + ":" + cred["passwd"] +
-                                          "@" + cred["host"] + ":" +
-                                          "3306" + "/" + cred["database"])
+        self.workers = max(1, int(workers))
+        url = cred.get("url")
+        if url is None:
+            url = "mysql+mysqlconnector://" + cred["user"] + ":" + \
+                  cred["passwd"] + "@" + cred["host"] + ":" + "3306" + \
+                  "/" + cred["database"]
+        pool = {}
+        if not url.startswith("sqlite"):
+            pool = {"pool_size"    : max(5, self.workers),
+                    "max_overflow" : self.workers}
+        self.engine = sqlalchemy.create_engine(url, pool_pre_ping=True, **pool)
+
+        # every thread gets its own session
+        self.session = scoped_session(sessionmaker(bind=self.engine))
 
-        Session = sessionmaker(bind=self.engine)
-        self.session = Session()
+        if isinstance(cache, str):
+            cache = KITCache(cache)
+        self.cache = cache
+        self.validate = validate
+        self.lru = KITLRU(lru_size, lru_ttl)
+
+        self.log = None
+        if profile or trace is not None:
+            self.log = KITQueryLog(self.engine, trace,
+                                   os.path.abspath(__file__))
 
     #####################
     # basic table search#
@@ -70,70 +135,370 @@ class KITSearch(object):
     ####################
     def probe_search_for_name(self,name,project):
         dic = {}
-        PID = []
-        for col in self.search_in_info(name,para="name"):
-            if col.project == project:
-                UID = col.ID
-        for row in self.search_in_probe(UID,"UID"):
-            PID.append(row.probeid)
-        for run in PID:
-            sub = self.probe_search_for_PID(run)
-            temp = sub.pop("PID")
+        for temp, sub in self.probe_search_for_project(project,[name]).items():
+            sub.pop("PID")
             sub.update({"PID" : temp})
             dic.update({temp : sub})
         return dic
 
+    def probe_find_PIDs(self,project=None,names=None,paraY=None):
+        """ PIDs of all probe station measurements that match the filters.
+            Probe and info table are joined, so this is a single query.
+
+            Args:
+                project (None|str): project of the sensors
+                names (None|list): sensor names
+                paraY (None|str|list): measured quantity, e.g. "I_tot"
+
+            Returns:
+                list: PIDs in ascending order
+        """
+        stmt = select(db_probe.probeid)\
+            .join(db_info, db_info.ID == db_probe.ID)\
+            .order_by(db_probe.probeid)
+        if project is not None:
+            stmt = stmt.where(db_info.project == project)
+        if names is not None:
+            stmt = stmt.where(db_info.name.in_(list(names)))
+        if paraY is not None:
+            if isinstance(paraY, str):
+                paraY = [paraY]
+            stmt = stmt.where(db_probe.paraY.in_(list(paraY)))
+        return [row[0] for row in self.session.execute(stmt)]
+
+    def probe_search_for_project(self,project=None,names=None,paraY=None,
+                                 **kwargs):
+        """ Prefetch all probe station measurements of a project, a list of
+            sensors and/or a measured quantity (see probe_find_PIDs). Data
+            and metadata are fetched in bulk by probe_search_for_PIDs and end
+            up in the local cache if there is one.
+
+            Args:
+                kwargs: passed on to probe_search_for_PIDs, e.g. workers
+
+            Returns:
+                OrderedDict: {PID : dict of probe_search_for_PID}
+        """
+        return self.probe_search_for_PIDs(self.probe_find_PIDs(project, names,
+                                                               paraY),
+                                          **kwargs)
+
     def probe_search_for_PID(self,PID):
+        dic = self.probe_search_for_PIDs([PID])
+        if int(PID) in dic:
+            return dic[int(PID)]
+        return self.__decode_probe_data(None)
+
+    def probe_search_for_PIDs(self,PIDs,batchsize=500,workers=None):
+        """ Bulk version of probe_search_for_PID. Metadata and data points of
+            all PIDs are fetched with two 'IN (...)' queries per batch.
+
+            Args:
+                PIDs (list): probe IDs
+                batchsize (int): maximum number of PIDs per query
+                workers (None|int): number of threads that fetch batches
+                    concurrently. Defaults to the workers of KITSearch
+
+            Returns:
+                OrderedDict: {PID : dict of probe_search_for_PID} in the order
+                             of PIDs. Unknown PIDs are left out.
+        """
+        PIDs = list(OrderedDict.fromkeys(int(PID) for PID in PIDs))
+        found = self.__from_cache("probe", PIDs)
+        missing = [PID for PID in PIDs if PID not in found]
+
+        # give every worker at least one batch
+        workers = self.workers if workers is None else max(1, int(workers))
+        batchsize = max(1, min(batchsize, -(-len(missing) // workers)))
+        batches = [missing[i:i+batchsize]
+                   for i in range(0, len(missing), batchsize)]
+
+        def fetch(batch):
+            with self.__tag("PID", batch):
+                return (self.__query_probe_info(batch),
+                        self.__query_probe_data(batch))
+        for batch, (info, data) in zip(batches,
+                                       self.__map(fetch, batches, workers)):
+            for PID in batch:
+                if PID in info:
+                    sub = data.get(PID, self.__decode_probe_data(None))
+                    sub.setdefault("lastUID", None)
+                    sub.update(info[PID])
+                    found[PID] = sub
+                    if self.cache is not None:
+                        self.cache.put("probe", PID,
+                                       self.__probe_token(sub["date"],
+                                                          len(sub["dataX"])),
+                                       sub["flag"] != "meas", sub)
+
+        dic = OrderedDict()
+        for PID in PIDs:
+            if PID in found:
+                dic[PID] = found[PID]
+        return dic
+
+    def probe_search_for_data(self,PID):
+        cached = self.__cached_probe(PID)
+        if cached is not None:
+            return cached[1]
+        with self.__tag("PID", [PID]):
+            data = self.__query_probe_data([PID])
+        return data.get(PID, self.__decode_probe_data(None))
+
+    def probe_search_for_tail(self,PID,last=None):
+        """ Data points of a PID that were added after a previous fetch,
+            e.g. of a measurement that is still running.
+
+            Args:
+                PID (int): probe ID
+                last (None|int): highest probe_uid that is already known
+                    (key "lastUID" of probe_search_for_data). None fetches
+                    all rows
+
+            Returns:
+                tuple(dict, last): new data points like probe_search_for_data
+                                   and the highest probe_uid so far
+        """
+        stmt = select(db_probe_data.probe_uid,
+                      *[getattr(db_probe_data, col)
+                        for key, col, dtype in self.__probe_data_columns])\
+            .where(db_probe_data.probeid == PID)\
+            .order_by(db_probe_data.probe_uid)
+        if last is not None:
+            stmt = stmt.where(db_probe_data.probe_uid > last)
+        self.__endRead()
+        with self.__tag("PID", [PID]):
+            rows = self.session.execute(stmt).fetchall()
+
+        if len(rows) == 0:
+            return self.__decode_probe_data(None), last
+        table = np.array(list(map(tuple, rows)), dtype=object)
+        return self.__decode_probe_data(table[:, 1:]), int(table[-1, 0])
+
+    def probe_iter_data(self,PID,chunksize=10000):
+        """ Generator over the data points of a PID. The rows are fetched
+            through an unbuffered cursor and decoded chunk by chunk, so only
+            a single chunk is held in memory at a time. SQLAlchemy's
+            mysqlconnector dialect only uses buffered cursors, there the
+            query runs on an unbuffered DB-API cursor of its own (bypassing
+            the query log). Other backends use stream_results/yield_per.
+
+            Args:
+                PID (int): probe ID
+                chunksize (int): number of rows per chunk
+
+            Yields:
+                dict: one array per key of probe_search_for_data
+        """
+        cached = self.__cached_probe(PID)
+        if cached is not None:
+            data = cached[1]
+            for start in range(0, len(data["dataX"]), chunksize):
+                yield {key : data[key][start:start+chunksize]
+                       for key, col, dtype in self.__probe_data_columns}
+            return
+
+        stmt = select(*[getattr(db_probe_data, col)
+                        for key, col, dtype in self.__probe_data_columns])\
+            .where(db_probe_data.probeid == PID)\
+            .order_by(db_probe_data.probe_uid)
+
+        if self.engine.dialect.driver == "mysqlconnector":
+            for rows in self.__raw_stream(stmt, chunksize, buffered=False):
+                yield self.__decode_probe_data(np.array(rows, dtype=object))
+            return
+
+        stmt = stmt.execution_options(stream_results=True, yield_per=chunksize)
+        with self.__tag("PID", [PID]):
+            result = self.session.execute(stmt)
+        try:
+            for rows in result.partitions(chunksize):
+                table = np.array(list(map(tuple, rows)), dtype=object)
+                yield self.__decode_probe_data(table)
+        finally:
+            result.close()
+
+    def __raw_stream(self,stmt,chunksize,**cursor_args):
+        """ Rows of a statement in chunks, fetched with fetchmany from a
+            DB-API cursor of its own (e.g. buffered=False for mysqlconnector)
+        """
+        compiled = stmt.compile(dialect=self.engine.dialect)
+        params = compiled.construct_params()
+        if compiled.positional:
+            params = [params[name] for name in compiled.positiontup]
+
+        cnx = self.engine.raw_connection()
+        done = False
+        try:
+            cursor = cnx.cursor(**cursor_args)
+            cursor.execute(str(compiled), params)
+            while True:
+                rows = cursor.fetchmany(chunksize)
+                if len(rows) == 0:
+                    break
+                yield rows
+            cursor.close()
+            done = True
+        finally:
+            if done:
+                cnx.close()
+            else:
+                # unread rows are left on the connection, do not reuse it
+                cnx.invalidate()
+
+    def probe_stream_data(self,PID,chunksize=10000,callback=None):
+        """ Streaming version of probe_search_for_data. Chunks of
+            probe_iter_data are copied into preallocated buffers that grow by
+            doubling, so no intermediate python lists are built.
+
+            Args:
+                PID (int): probe ID
+                chunksize (int): number of rows per chunk
+                callback (None|callable): called with every chunk (dict of
+                    arrays) as soon as it arrives, e.g. for incremental
+                    plotting
+
+            Returns:
+                dict: one array per key like probe_search_for_data
+        """
+        size = 0
+        capacity = chunksize
+        buffers = {key : np.empty(capacity, dtype=dtype)
+                   for key, col, dtype in self.__probe_data_columns}
+
+        for chunk in self.probe_iter_data(PID, chunksize):
+            if callback is not None:
+                callback(chunk)
+            n = len(chunk["dataX"])
+            if size + n > capacity:
+                capacity = max(2 * capacity, size + n)
+                for key, values in buffers.items():
+                    grown = np.empty(capacity, dtype=values.dtype)
+                    grown[:size] = values[:size]
+                    buffers[key] = grown
+            for key, values in chunk.items():
+                buffers[key][size:size+n] = values
+            size += n
+
+        return {key : values[:size] for key, values in buffers.items()}
+
+    def probe_search_for_info(self,PID):
+        """ Metadata of a probe station measurement without its data points.
+            Probe, info and irradiation tables are joined, so everything is
+            fetched in a single round trip.
+        """
+        cached = self.__cached_probe(PID)
+        if cached is not None:
+            return cached[0]
+        with self.__tag("PID", [PID]):
+            return self.__query_probe_info([PID]).get(PID, {})
+
+    def __query_probe_data(self,PIDs):
+        """ Data points of several PIDs in one query. Only the needed columns
+            are selected as raw tuples (no ORM objects) and decoded into
+            numpy arrays. The rows are sorted by PID and split at the
+            positions where the PID changes.
+        """
+        stmt = select(db_probe_data.probeid, db_probe_data.probe_uid,
+                      *[getattr(db_probe_data, col)
+                        for key, col, dtype in self.__probe_data_columns])\
+            .where(db_probe_data.probeid.in_(PIDs))\
+            .order_by(db_probe_data.probeid, db_probe_data.probe_uid)
+        rows = self.session.execute(stmt).fetchall()
+
+        dic = {}
+        if len(rows) == 0:
+            return dic
+
+        # plain tuples, numpy probes Row objects for the array interface
+        table = np.array(list(map(tuple, rows)), dtype=object)
+        pid = table[:, 0].astype("int64")
+        uid = table[:, 1].astype("int64")
+        data = self.__decode_probe_data(table[:, 2:])
+
+        bounds = np.flatnonzero(pid[1:] != pid[:-1]) + 1
+        starts = np.concatenate(([0], bounds)).astype("int64")
+        stops = np.concatenate((bounds, [len(rows)])).astype("int64")
+
+        for start, stop in zip(starts, stops):
+            dic[int(pid[start])] = {key : values[start:stop]
+                                    for key, values in data.items()}
+            # highest probe_uid, see probe_search_for_tail
+            dic[int(pid[start])]["lastUID"] = int(uid[stop-1])
+        return dic
+
+    def __decode_probe_data(self,table):
+        """ Turn a table of probe data columns (or None) into the data
+            dictionary with one array per key
+        """
         dic = {}
-        dataX = []
-        dataY = []
-        dataZ = []
-        temp = []
-        rh = []
-        err = []
-        time = []
-        bias_cur = []
-
-        for row in self.search_in_probe_data(PID):
-            dataX.append(row.datax)
-            dataY.append(row.datay)
-            dataZ.append(row.dataz)
-            temp.append(row.temperature)
-            rh.append(row.RH)
-            err.append(row.errory)
-            time.append(row.time)
-            bias_cur.append(row.bias_current)
-
-        dic.update({"dataX"     : dataX,
-                    "dataY"     : dataY,
-                    "dataZ"     : dataZ,
-                    "temp"      : temp,
-                    "rh"        : rh,
-                    "err"       : err,
-                    "time"      : time,
-                    "bias_cur"  : bias_cur})
-
-        for col in self.search_in_probe(PID):
-            dic.update({"paraX"     : col.paraX,
-                        "paraY"     : col.paraY,
-                        "t0"        : col.temperature,
-                        "h0"        : col.RH,
-                        "PID"       : col.probeid,
-                        "UID"       : col.ID,
-                        "date"      : col.date})
-
-        for col in self.search_in_info(dic["UID"],para="UID"):
-            dic.update({"name"      : col.name,
-                        "project"   : col.project})
-
-        fluence, pt = self.getFluence(dic["UID"],dic["date"])
-        dic.update({"fluence"       : fluence,
-                    "particletype"  : pt})
+        for i, (key, col, dtype) in enumerate(self.__probe_data_columns):
+            if table is None:
+                dic[key] = np.empty(0, dtype=dtype)
+            else:
+                dic[key] = np.ascontiguousarray(table[:, i].astype(dtype))
+        return dic
+
+    def __query_probe_info(self,PIDs):
+        """ Metadata of several PIDs in one query (see probe_search_for_info)
+        """
+        dic = OrderedDict()
+        fluence = {}
+        pt = {}
+        query = self.session.query(db_probe.paraX, db_probe.paraY,
+                                   db_probe.temperature, db_probe.RH,
+                                   db_probe.probeid, db_probe.ID,
+                                   db_probe.date, db_probe.flag, db_info.name,
+                                   db_info.project, db_info.F_p_aim_n_cm2,
+                                   db_info.F_n_aim_n_cm2,
+                                   db_irradiation.F_n_cm2,
+                                   db_irradiation.particletype)\
+            .outerjoin(db_info, db_info.ID == db_probe.ID)\
+            .outerjoin(db_irradiation,
+                       and_(db_irradiation.ID == db_probe.ID,
+                            func.date(db_irradiation.date)
+                            < func.date(db_probe.date)))\
+            .filter(db_probe.probeid.in_(PIDs))
+
+        for col in query:
+            dic[col.probeid] = {"paraX"     : col.paraX,
+                                "paraY"     : col.paraY,
+                                "t0"        : col.temperature,
+                                "h0"        : col.RH,
+                                "PID"       : col.probeid,
+                                "UID"       : col.ID,
+                                "date"      : col.date,
+                                "flag"      : col.flag,
+                                "name"      : col.name,
+                                "Fp"        : col.F_p_aim_n_cm2,
+                                "Fn"        : col.F_n_aim_n_cm2,
+                                "project"   : col.project}
+            fluence.setdefault(col.probeid, [])
+            pt.setdefault(col.probeid, [])
+            if col.F_n_cm2 is not None:
+                fluence[col.probeid].append(col.F_n_cm2)
+                pt[col.probeid].append(col.particletype)
+
+        for PID in dic:
+            F, particle = self.formatFluence(fluence[PID], pt[PID])
+            dic[PID].update({"fluence"       : F,
+                             "particletype"  : particle})
         return dic
 
     def ali_search_for_run(self,nr):
+        with self.__tag("run", [nr]):
+            return self.__ali_search_for_run(nr)
+
+    def __ali_search_for_run(self,nr):
+        cached = self.__from_cache("alibava", [nr])
+        if nr in cached:
+            return cached[nr]
+
         dic = {}
-        for col in self.search_in_alibava(nr):
+        stmt = select(*[getattr(db_alibava, col)
+                        for col in self.__alibava_run_columns])\
+            .where(db_alibava.run == nr)
+        for col in self.session.execute(stmt):
             dic.update({"voltage"       : col.voltage,
                         "e_sig"         : col.electron_sig,
                         "e_sig_err"     : col.signal_e_err,
@@ -144,83 +509,484 @@ class KITSearch(object):
                         "seedADC_err"   : col.SeedSig_MPV_err})
             ID = col.ID
             date = col.date
+            token = str(col.last_analyzed)
+            final = col.flag != "meas"
 
         dic.update({"annealing" : self.getAnnealing(ID,date)})
+        dic.update(self.getInfo(ID))
 
-        for col in self.search_in_info(ID,para="UID"):
-            dic.update({"name"      : col.name,
-                        "Fp"        : col.F_p_aim_n_cm2,
-                        "Fn"        : col.F_n_aim_n_cm2,
-                        "project"   : col.project})
+        if self.cache is not None:
+            self.cache.put("alibava", nr, token, final, dic)
 
         return dic
 
+    def ali_search_for_runs(self,runs,workers=None):
+        """ ali_search_for_run for many runs, spread over the worker threads
+
+            Returns:
+                OrderedDict: {run : dict of ali_search_for_run} in the order
+                             of runs
+        """
+        runs = list(OrderedDict.fromkeys(runs))
+        return OrderedDict(zip(runs, self.__map(self.ali_search_for_run,
+                                                runs, workers)))
+
     def ali_search_for_name_voltage(self,name,voltage,project):
         dic = {}
-        for col in self.search_in_info(name,"name"):
-            if col.project == project:
-                ID = col.ID
-        for col in self.search_in_alibava(ID,"ID"):
+        ID = self.__sensor_ID(name,project)
+        if ID is None:
+            return dic
+        # |voltage| within +-1%, filtered by the database
+        window = and_(func.abs(db_alibava.voltage) > voltage*0.99,
+                      func.abs(db_alibava.voltage) < voltage*1.01)
+        for col in self.__ali_scan(ID,window):
             sub = {}
-            if (voltage*0.99)<abs(col.voltage)<(voltage*1.01):
-                sub.update({"voltage"       : col.voltage,
-                            "date"          : col.date,
-                            "e_sig"         : col.electron_sig,
-                            "e_sig_err"     : col.signal_e_err,
-                            "gain"          : col.gain,
-                            "seed"          : col.SeedSigENC_MPV,
-                            "seed_err"      : col.SeedSigENC_MPV_err,
-                            "annealing"     : self.getAnnealing(ID,col.date),
-                            "name"          : name,
-                            "project"       : project,
-                            "fluence"       : None})
-                dic.update({col.run : sub})
+            annealing = self.getAnnealing(ID,col.date)
+            sub.update({"voltage"       : col.voltage,
+                        "date"          : col.date,
+                        "e_sig"         : col.electron_sig,
+                        "e_sig_err"     : col.signal_e_err,
+                        "gain"          : col.gain,
+                        "seed"          : col.SeedSigENC_MPV,
+                        "seed_err"      : col.SeedSigENC_MPV_err,
+                        "annealing"     : annealing,
+                        "name"          : name,
+                        "project"       : project,
+                        "fluence"       : None})
+            dic.update({col.run : sub})
         return dic
 
     def ali_search_for_name_annealing(self,name,annealing,project):
         dic = {}
-        for col in self.search_in_info(name,"name"):
-            if col.project == project:
-                ID = col.ID
-        for col in self.search_in_alibava(ID,"ID"):
+        ID = self.__sensor_ID(name,project)
+        if ID is None:
+            return dic
+        dates, total = self.getTimeline(ID)["annealing"]
+
+        # The annealing time only changes at the annealing dates. Every
+        # interval whose value lies within +-1% becomes a date range.
+        ranges = []
+        for i in range(len(dates)+1):
+            value = round(total[i-1]) if i else 0
+            if not (annealing*0.99)<abs(value)<(annealing*1.01):
+                continue
+            cond = []
+            if i > 0:
+                cond.append(db_alibava.date > dates[i-1])
+            if i < len(dates):
+                cond.append(db_alibava.date <= dates[i])
+            ranges.append(and_(db_alibava.date.isnot(None), *cond))
+        if len(ranges) == 0:
+            return dic
+
+        for col in self.__ali_scan(ID,or_(*ranges)):
             sub = {}
-            if (annealing*0.99)<abs(self.getAnnealing(ID,col.date))<(annealing*1.01):
-                sub.update({"voltage"       : col.voltage,
-                            "date"          : col.date,
-                            "e_sig"         : col.electron_sig,
-                            "e_sig_err"     : col.signal_e_err,
-                            "gain"          : col.gain,
-                            "seed"          : col.SeedSigENC_MPV,
-                            "seed_err"      : col.SeedSigENC_MPV_err,
-                            "annealing"     : self.getAnnealing(ID,col.date)})
-                dic.update({col.run : sub})
+            sub.update({"voltage"       : col.voltage,
+                        "date"          : col.date,
+                        "e_sig"         : col.electron_sig,
+                        "e_sig_err"     : col.signal_e_err,
+                        "gain"          : col.gain,
+                        "seed"          : col.SeedSigENC_MPV,
+                        "seed_err"      : col.SeedSigENC_MPV_err,
+                        "annealing"     : self.getAnnealing(ID,col.date)})
+            dic.update({col.run : sub})
         return dic
 
+    def __sensor_ID(self,name,project):
+        """ UID of a sensor or None
+        """
+        stmt = select(db_info.ID)\
+            .where(and_(db_info.name == name, db_info.project == project))\
+            .order_by(db_info.ID)
+        IDs = [row[0] for row in self.session.execute(stmt)]
+        return IDs[-1] if IDs else None
+
+    def __ali_scan(self,ID,condition):
+        """ Projected alibava rows of a sensor that match a condition
+        """
+        stmt = select(*[getattr(db_alibava, col)
+                        for col in self.__alibava_scan_columns])\
+            .where(and_(db_alibava.ID == ID, condition))\
+            .order_by(db_alibava.run)
+        return self.session.execute(stmt)
+
+    def getInfo(self,ID):
+        """ Name, project and aimed fluences of a sensor (cached)
+        """
+        def fetch():
+            dic = {}
+            for col in self.search_in_info(ID,para="UID"):
+                dic.update({"name"      : col.name,
+                            "Fp"        : col.F_p_aim_n_cm2,
+                            "Fn"        : col.F_n_aim_n_cm2,
+                            "project"   : col.project})
+            return dic
+        return dict(self.lru.lookup(("info", ID), fetch))
+
+    def getAnnealingHistory(self,ID):
+        """ List of (date, equivalent annealing time) of a sensor sorted by
+            date (cached)
+        """
+        stmt = select(db_annealing.date, db_annealing.equiv)\
+            .where(db_annealing.ID == ID)\
+            .order_by(db_annealing.date)
+        return self.lru.lookup(("annealing", ID), lambda:
+                               [tuple(row) for row in self.session.execute(stmt)])
+
+    def getIrradiationHistory(self,ID):
+        """ List of (date, fluence, particle type) of a sensor sorted by date
+            (cached)
+        """
+        stmt = select(db_irradiation.date, db_irradiation.F_n_cm2,
+                      db_irradiation.particletype)\
+            .where(db_irradiation.ID == ID)\
+            .order_by(db_irradiation.date)
+        return self.lru.lookup(("irradiation", ID), lambda:
+                               [tuple(row) for row in self.session.execute(stmt)])
+
+    def getTimeline(self,ID):
+        """ Cumulative annealing and irradiation history of a sensor (cached).
+            Every list is sorted by date, so the state at any date is found
+            by a binary search.
+
+            Returns:
+                dict: {"annealing" : (dates, cumulative equivalent time),
+                       "fluence"   : (days, cumulative fluence,
+                                      combined particle type)}
+        """
+        def build():
+            annealing = self.getAnnealingHistory(ID)
+            irradiation = self.getIrradiationHistory(ID)
+            aDates = [aDate for (aDate, equiv) in annealing]
+            aSum = np.cumsum([equiv or 0 for (aDate, equiv) in annealing])
+            iDays = [iDate.date() for (iDate, F, pt) in irradiation]
+            fSum = np.cumsum([F or 0 for (iDate, F, pt) in irradiation])
+            seen = set()
+            particles = []
+            for (iDate, F, pt) in irradiation:
+                seen.add(pt)
+                particles.append(self.__particleType(seen, len(particles) + 1))
+            return {"annealing" : (aDates, aSum.tolist()),
+                    "fluence"   : (iDays, fSum.tolist(), particles)}
+        return self.lru.lookup(("timeline", ID), build)
+
+    def lruStats(self):
+        """ Hit/miss counters and size of the in-memory lookup cache
+        """
+        return self.lru.stats()
+
     def getAnnealing(self,ID,date):
-        annealing = 0
-        for col in self.search_in_annealing(ID):
-            if date>col.date:
-                annealing += col.equiv
-        return round(annealing)
+        dates, total = self.getTimeline(ID)["annealing"]
+        # number of annealing steps before date
+        i = bisect.bisect_left(dates, date)
+        return round(total[i-1]) if i else 0
 
     def getFluence(self,ID,date):
-        fluence = 0
-        pt = []
-        for col in self.search_in_irradiation(ID):
-            if date.date()>col.date:
-                fluence += col.F_n_cm2
-                pt.append(col.particletype)
-        if set(pt) == set(["n","p"]):
-            pt = "(n,p)"
-        elif len(pt) == 1:
-            pt = pt[0]
-        else:
-            pt = ""
-        return ("{:0.0e}".format(fluence), pt)
+        days, fluence, pt = self.getTimeline(ID)["fluence"]
+        # irradiation dates are stored as DateTime, compare whole days
+        i = bisect.bisect_left(days, date.date())
+        if i == 0:
+            return self.formatFluence([], [])
+        return ("{:0.0e}".format(fluence[i-1]), pt[i-1])
+
+    def formatFluence(self,fluence,pt):
+        """ Sum of fluences and combined particle type of irradiations
+        """
+        return ("{:0.0e}".format(sum(fluence)),
+                self.__particleType(set(pt), len(pt)))
+
+    def __particleType(self,types,count):
+        """ Combined particle type of count irradiations with these types
+        """
+        if types == set(["n","p"]):
+            return "(n,p)"
+        elif count == 1:
+            return next(iter(types))
+        return ""
 
     def getSession(self):
         return self.session
 
+    ################
+    # profiling    #
+    ################
+    def stats(self):
+        """ Queries issued since the start (or resetStats)
+
+            Returns:
+                dict: number of queries, seconds and rows in "total", per
+                      KITSearch method ("methods") and per PID and run
+                      ("keys"), plus the most recent query records
+        """
+        if self.log is None:
+            raise ValueError("KITSearch was initialized without profile")
+        return self.log.stats()
+
+    def resetStats(self):
+        if self.log is not None:
+            self.log.reset()
+
+    def __tag(self,kind,keys):
+        """ Attribute the queries inside a with block to PIDs/runs
+        """
+        if self.log is None:
+            return nullcontext()
+        return self.log.tag(kind, keys)
+
+    def __map(self,func,items,workers=None):
+        """ Apply func to all items using a pool of worker threads. Results
+            keep the order of items.
+        """
+        workers = self.workers if workers is None else max(1, int(workers))
+        if workers == 1 or len(items) < 2:
+            return [func(item) for item in items]
+
+        def run(item):
+            try:
+                return func(item)
+            finally:
+                # return the connection of this thread to the pool
+                self.session.remove()
+
+        with ThreadPoolExecutor(max_workers=min(workers, len(items))) as pool:
+            return list(pool.map(run, items))
+
+    ################
+    # catalog      #
+    ################
+    def probe_catalog(self,page=0,pagesize=100,**filters):
+        """ Metadata of probe station measurements without any data points
+
+            Args:
+                page (int): number of the page, starting at 0
+                pagesize (int): number of records per page
+                filters: any of
+                    project (str): project of the sensors
+                    name (str): sensor name, SQL LIKE pattern ('%', '_')
+                    paraY (str|list): measured quantity, e.g. "I_tot"
+                    start, stop (datetime): range of the measurement date
+                    flag (str|list): e.g. "good"
+                    station (int|list): probe station
+
+            Returns:
+                list: one dict per measurement (PID, UID, name, project,
+                      paraX, paraY, date, flag, station, t0, h0) ordered by
+                      PID
+        """
+        stmt = self.__catalog_stmt("probe",**filters)\
+            .order_by(db_probe.probeid)\
+            .limit(pagesize).offset(page*pagesize)
+        return [dict(row._mapping) for row in self.session.execute(stmt)]
+
+    def probe_iter_catalog(self,pagesize=1000,**filters):
+        """ Generator over all records of probe_catalog. Pages are fetched
+            one after another by PID (keyset pagination).
+        """
+        return self.__iter_catalog("probe",db_probe.probeid,"PID",pagesize,
+                                   filters)
+
+    def ali_catalog(self,page=0,pagesize=100,**filters):
+        """ Metadata of ALiBaVa runs without any measurement results
+
+            Args:
+                page (int): number of the page, starting at 0
+                pagesize (int): number of records per page
+                filters: project, name, start, stop and flag like
+                    probe_catalog
+
+            Returns:
+                list: one dict per run (run, UID, name, project, voltage,
+                      date, flag) ordered by the alibava_uid
+        """
+        stmt = self.__catalog_stmt("alibava",**filters)\
+            .order_by(db_alibava.alibava_uid)\
+            .limit(pagesize).offset(page*pagesize)
+        return [self.__ali_record(row) for row in self.session.execute(stmt)]
+
+    def ali_iter_catalog(self,pagesize=1000,**filters):
+        """ Generator over all records of ali_catalog (keyset pagination)
+        """
+        return self.__iter_catalog("alibava",db_alibava.alibava_uid,
+                                   "alibava_uid",pagesize,filters)
+
+    def __iter_catalog(self,kind,key,label,pagesize,filters):
+        last = None
+        while True:
+            stmt = self.__catalog_stmt(kind,**filters)
+            if last is not None:
+                stmt = stmt.where(key > last)
+            rows = self.session.execute(stmt.order_by(key).limit(pagesize))\
+                .fetchall()
+            for row in rows:
+                if kind == "probe":
+                    yield dict(row._mapping)
+                else:
+                    yield self.__ali_record(row)
+            if len(rows) < pagesize:
+                return
+            last = rows[-1]._mapping[label]
+
+    def __ali_record(self,row):
+        dic = dict(row._mapping)
+        dic.pop("alibava_uid")
+        return dic
+
+    def __catalog_stmt(self,kind,project=None,name=None,paraY=None,
+                       start=None,stop=None,flag=None,station=None):
+        """ Select statement of the metadata of probe or alibava
+            measurements joined with the sensor info
+        """
+        if kind == "probe":
+            table = db_probe
+            stmt = select(db_probe.probeid.label("PID"),
+                          db_probe.ID.label("UID"), db_info.name,
+                          db_info.project, db_probe.paraX, db_probe.paraY,
+                          db_probe.date, db_probe.flag, db_probe.station,
+                          db_probe.temperature.label("t0"),
+                          db_probe.RH.label("h0"))
+        else:
+            if paraY is not None or station is not None:
+                raise ValueError("ALiBaVa runs have no paraY or station")
+            table = db_alibava
+            stmt = select(db_alibava.alibava_uid, db_alibava.run,
+                          db_alibava.ID.label("UID"), db_info.name,
+                          db_info.project, db_alibava.voltage,
+                          db_alibava.date, db_alibava.flag)
+        stmt = stmt.join(db_info, db_info.ID == table.ID)
+
+        for column, value in [(db_info.project, project),
+                              (table.flag, flag),
+                              (getattr(table, "paraY", None), paraY),
+                              (getattr(table, "station", None), station)]:
+            if value is None:
+                continue
+            if isinstance(value, (list, tuple, set)):
+                stmt = stmt.where(column.in_(list(value)))
+            else:
+                stmt = stmt.where(column == value)
+        if name is not None:
+            stmt = stmt.where(db_info.name.like(name))
+        if start is not None:
+            stmt = stmt.where(table.date >= start)
+        if stop is not None:
+            stmt = stmt.where(table.date <= stop)
+        return stmt
+
+    ################
+    # local cache  #
+    ################
+    def __from_cache(self,kind,keys):
+        """ Valid cache entries for PIDs/runs. Entries of closed measurements
+            are returned without touching the database (unless validate is
+            set), all others are checked against the current hints.
+        """
+        hits = {}
+        check = {}
+        if self.cache is None:
+            return hits
+        for key in keys:
+            entry = self.cache.get(kind, key)
+            if entry is None:
+                continue
+            token, final, result = entry
+            # probe entries written before lastUID was stored
+            if kind == "probe" and "lastUID" not in result:
+                continue
+            if final and not self.validate:
+                hits[key] = result
+            else:
+                check[key] = (token, result)
+
+        if len(check) != 0:
+            if kind == "probe":
+                tokens = self.__probe_tokens(list(check))
+            else:
+                tokens = self.__alibava_tokens(list(check))
+            for key, (token, result) in check.items():
+                if tokens.get(key) == token:
+                    hits[key] = result
+        return hits
+
+    def __cached_probe(self,PID):
+        """ Valid cache entry of a PID split into its metadata and its data
+            points, or None
+        """
+        result = self.__from_cache("probe", [int(PID)]).get(int(PID))
+        if result is None:
+            return None
+        keys = [key for key, col, dtype in self.__probe_data_columns]
+        keys.append("lastUID")
+        info = {key : value for key, value in result.items()
+                if key not in keys}
+        return info, {key : result.get(key) for key in keys}
+
+    def __endRead(self):
+        """ End the read transaction of this thread's session. InnoDB keeps
+            a snapshot per transaction (REPEATABLE READ), so without this
+            rows committed later by a running measurement stay invisible.
+        """
+        self.session.rollback()
+
+    def __probe_token(self,date,count):
+        return "%s|%i" %(date, count)
+
+    def __probe_tokens(self,PIDs):
+        """ Current validation tokens (date and number of rows) of PIDs
+        """
+        self.__endRead()
+        stmt = select(db_probe.probeid, db_probe.date,
+                      func.count(db_probe_data.probe_uid))\
+            .outerjoin(db_probe_data,
+                       db_probe_data.probeid == db_probe.probeid)\
+            .where(db_probe.probeid.in_(PIDs))\
+            .group_by(db_probe.probeid, db_probe.date)
+        return {PID : self.__probe_token(date, count)
+                for PID, date, count in self.session.execute(stmt)}
+
+    def __alibava_tokens(self,runs):
+        """ Current validation tokens (last analysis) of ALiBaVa runs
+        """
+        self.__endRead()
+        stmt = select(db_alibava.run, db_alibava.last_analyzed)\
+            .where(db_alibava.run.in_(runs))
+        return {run : str(last) for run, last in self.session.execute(stmt)}
+
+    def prewarm(self,PIDs=(),runs=(),project=None):
+        """ Fill the local cache with probe station PIDs and ALiBaVa runs.
+            With a project all of its probe station PIDs are added.
+
+            Returns:
+                number of PIDs and runs that are available in the cache
+        """
+        if self.cache is None:
+            raise ValueError("KITSearch was initialized without cache")
+        PIDs = list(PIDs)
+        if project is not None:
+            PIDs += self.probe_find_PIDs(project)
+        count = len(self.probe_search_for_PIDs(PIDs))
+        for run in runs:
+            self.ali_search_for_run(run)
+            count += 1
+        return count
+
+    def cacheInfo(self):
+        """ Number of cached entries and bytes per kind
+        """
+        if self.cache is None:
+            raise ValueError("KITSearch was initialized without cache")
+        return self.cache.info()
+
+    def purgeCache(self,PID=None,run=None):
+        """ Remove a PID, a run or (without arguments) all cache entries
+        """
+        if self.cache is None:
+            raise ValueError("KITSearch was initialized without cache")
+        if PID is not None:
+            return self.cache.purge("probe", PID)
+        elif run is not None:
+            return self.cache.purge("alibava", run)
+        return self.cache.purge()
+
 if __name__ == '__main__':
 
     db = {"host": "192.168.13.2",
@@ -1,6 +1,7 @@
 """ Utility methods
 """
 
+import numpy as np
 from collections import OrderedDict
 
 def get_KITcolor():
@@ -84,13 +85,31 @@ def adjustOrder(List, entryDict, len_total):
     return List
 
 
-def manipulate(graphList, arg):
+def manipulate(graphList, arg, files=None, steps=()):
+    """ Normalizes the y values of all graphs.
+
+        Args:
+            graphList (list): list of graphs [x, y, (dx, dy)]
+            arg (str): '1/C^{2}' or 'CV', 'off' or a list of factors
+            files (list): KITData objects the graphs were created from. If
+                          given, the results are taken from their derived
+                          quantity cache instead of being recomputed
+            steps (tuple): transformations already applied to the y values
+                           of the graphs, e.g. ("abs",)
+    """
 
     facList = []
     tempGraphs = graphList
 
+    if files is not None and len(files) != len(graphList):
+        files = None
+
     # normalization for CV plots
-    if arg in ["1/C^{2}", "CV"]:
+    if arg in ["1/C^{2}", "CV"] and files is not None:
+        for i, graph in enumerate(graphList):
+            graph[1] = files[i].derive("y", *(steps + ("invsquare",)))
+
+    elif arg in ["1/C^{2}", "CV"]:
         for i, graph in enumerate(graphList):
             for y in graph:
                 tempList = []
@@ -113,6 +132,10 @@ def manipulate(graphList, arg):
             raise ValueError("Invalid normalization input! Number of "
                              "factors differs from the number of graphs.")
         for i, graph in enumerate(graphList):
+            if files is not None:
+                graph[1] = files[i].derive("y", *(steps + (("scale",
+                                                  float(facList[i])),)))
+                continue
             tempList = []
             for val in graph[1]:
                 tempList.append(val/float(facList[i]))
@@ -120,6 +143,113 @@ def manipulate(graphList, arg):
 
     return graphList
 
+def splitRamp(bias, x, y):
+    """ Splits a ramp measurement (RPunch/REdge) into one graph per bias
+        voltage. A new segment starts wherever the bias value changes, so
+        all boundaries are found in a single vectorized pass.
+
+        Args:
+            bias: bias voltage of every data point (V_bias)
+            x: x value of every data point (V_edge)
+            y: y value of every data point (I_edge)
+
+        Returns:
+            OrderedDict: {V_bias : (V_edge, I_edge)} where V_edge and I_edge
+                         are views on the input arrays
+    """
+
+    bias = np.asarray(bias)
+    x = np.asarray(x)
+    y = np.asarray(y)
+
+    dic = OrderedDict()
+    if len(bias) == 0:
+        return dic
+
+    bounds = np.flatnonzero(bias[1:] != bias[:-1]) + 1
+    starts = np.concatenate(([0], bounds))
+    stops = np.concatenate((bounds, [len(bias)]))
+
+    for start, stop in zip(starts, stops):
+        dic[bias[start].item()] = (x[start:stop], y[start:stop])
+
+    return dic
+
+def resample(files, grid=None, points=None):
+    """ Interpolates the y values of many measurements onto a common x grid.
+        All curves are shifted into disjoint x intervals and concatenated,
+        so the interpolation of every curve at every grid point is done by a
+        single np.interp call.
+
+        Args:
+            files (list|KITPlot): KITData objects or a KITPlot object
+            grid (list): common x values. If None, the grid spans the x range
+                         of all measurements
+            points (int): number of points of the inferred grid. Defaults to
+                          the size of the largest measurement
+
+        Returns:
+            tuple(grid, values, mask): grid with M points, (N, M) array of
+                                       interpolated y values (NaN outside the
+                                       range of a measurement) and (N, M)
+                                       mask that is True for those points
+    """
+
+    if hasattr(files, "getFiles"):
+        files = files.getFiles()
+
+    xs = [np.asarray(File.getX(), dtype=float) for File in files]
+    ys = [np.asarray(File.getY(), dtype=float) for File in files]
+    nFiles = len(xs)
+
+    # remove points that can not be interpolated
+    for i in range(nFiles):
+        valid = np.isfinite(xs[i]) & np.isfinite(ys[i])
+        xs[i] = xs[i][valid]
+        ys[i] = ys[i][valid]
+
+    sizes = np.array([len(x) for x in xs], dtype="int64")
+    xcat = np.concatenate(xs) if nFiles else np.empty(0)
+    ycat = np.concatenate(ys) if nFiles else np.empty(0)
+    idx = np.repeat(np.arange(nFiles), sizes)
+
+    if grid is None:
+        if len(xcat) == 0:
+            raise ValueError("Can not infer a grid from empty measurements")
+        if points is None:
+            points = int(sizes.max())
+        grid = np.linspace(xcat.min(), xcat.max(), points)
+    grid = np.asarray(grid, dtype=float)
+
+    values = np.full((nFiles, len(grid)), np.nan)
+    mask = np.ones((nFiles, len(grid)), dtype=bool)
+    if len(xcat) == 0 or len(grid) == 0:
+        return grid, values, mask
+
+    # normalize all x values to [0,1] and move curve i to [2i, 2i+1]
+    low = min(xcat.min(), grid.min())
+    span = max(xcat.max(), grid.max()) - low
+    span = span if span > 0 else 1.
+    order = np.lexsort((xcat, idx))
+    xcat = (xcat[order] - low) / span + 2. * idx[order]
+    ycat = ycat[order]
+
+    # first and last x value of every curve
+    filled = sizes > 0
+    stops = np.cumsum(sizes)
+    lo = np.full(nFiles, np.inf)
+    hi = np.full(nFiles, -np.inf)
+    lo[filled] = xcat[stops[filled] - sizes[filled]]
+    hi[filled] = xcat[stops[filled] - 1]
+
+    query = (grid[np.newaxis, :] - low) / span \
+            + 2. * np.arange(nFiles)[:, np.newaxis]
+    mask = (query < lo[:, np.newaxis]) | (query > hi[:, np.newaxis])
+    values = np.interp(query.ravel(), xcat, ycat).reshape(query.shape)
+    values[mask] = np.nan
+
+    return grid, values, mask
+
 def extractList(arg, output="int"):
     """ Turns a 'str(list)' into a list. Converts its elements into
         floats if possible. Real strings as well as other types are just
@@ -210,10 +340,8 @@ def interpolate(List, x=None, y=None):
         y = []
 
         for File in List:
-            x = File.getX()
-            y = File.getY()
             name = File.getName()
-            m, b = np.polyfit(x, y, 1)
+            m, b = File.fit(1)
             v.append((name, abs(m)))
 
     return v
@@ -225,11 +353,9 @@ def makeFit(List, print_fit, draw_fit):
 
     print("Fit Results:")
 
-    if isinstance(List, KITData):
-        x = List.getX()
-        y = List.getY()
-
-        p0, p1 = abs(np.polyfit(x ,y, 1))
+    # KITData objects provide cached fits
+    if hasattr(List, "fit"):
+        p0, p1 = abs(List.fit(1))
 
 
         print("{:>8} {:>8} {:>8}".format(List.getName(),
@@ -1,9 +1,16 @@
 #!/usr/bin/env python3
 import os,sys
+import gzip
+import lzma
+import hashlib
+import json
+import struct
+import itertools
 import numpy as np
 import mysql.connector
 from .KITConfig import KITConfig
 from .KITSearch import KITSearch
+from .Utils import kitutils
 from collections import OrderedDict
 import datetime
 
@@ -16,19 +23,80 @@ class KITData(object):
 
     dbSession = None
 
+    # Names of all measurement columns that are stored per data point
+    __columns = ("x", "y", "z", "dx", "dy", "dz", "temp", "humid", "err",
+                 "bias_current", "time")
+
+    # Transformations that can be applied to a column by KITData.derive
+    __transforms = {
+        "abs"       : lambda values: np.absolute(values),
+        "invsquare" : lambda values: np.divide(1., values * values,
+                                               out=np.zeros(len(values)),
+                                               where=values != 0),
+        "scale"     : lambda values, fac: values / float(fac)}
+
+    # File signature and alignment of the binary KITData archive (.kit)
+    __archiveMagic = b"KITDATA\x01"
+    __archiveAlign = 64
+
+    # Columns and the matching keys of KITSearch probe data dictionaries
+    __dbColumns = (("x", "dataX"), ("y", "dataY"), ("z", "dataZ"),
+                   ("temp", "temp"), ("humid", "rh"), ("err", "err"),
+                   ("bias_current", "bias_cur"), ("time", "time"))
+
+    # Column layout of data files depending on the number of columns
+    __fileLayouts = {2: ("x", "y"),
+                     3: ("x", "y", "z"),
+                     4: ("x", "y", "dx", "dy"),
+                     6: ("x", "y", "z", "dx", "dy", "dz")}
+
     def __init__(self, dataInput=None, measurement="probe",
-                 credentials='db.cfg', show_input=None):
+                 credentials='db.cfg', show_input=None, columnar=False,
+                 dtype="float64", cache=False, columns=None, stream=False,
+                 chunksize=100000, maxPoints=10000, lazy=False):
         """ Initialize KITData object based on the input that is passed.
 
         Args:
-            dataInput (None|pid|file): Only pid inputs will fill all additional
-                information automatically
+            dataInput (None|pid|file|dict): Only pid inputs will fill all
+                additional information automatically. Files ending with
+                '.kit' are binary archives written by KITData.save. A dict
+                is a result of KITSearch.probe_search_for_PID(s)
             measurement (probe|alibava): Specify if PID belongs to a probe
                 station or alibava measurement
             credentials (str): Specify the credentials file for the database if
                 the file is not located in the current working directory
+            columnar (True|False): Store every column as a contiguous typed
+                numpy array instead of a list. The get methods then return
+                the arrays themselves without copying them
+            dtype (float64|float32): Data type of the numeric columns in
+                columnar mode. Time is always stored as datetime64
+            cache (True|False): Keep a binary copy of parsed data files in a
+                '.kitcache' folder next to the file and memory-map it on the
+                next load as long as the file is unchanged
+            columns (None|tuple): Names of the file columns, e.g.
+                ("time", "temp", "humid"). By default the layout is derived
+                from the number of columns in the file
+            stream (True|False): Read the file (also .gz/.xz) or the data
+                points of a PID in chunks of 'chunksize' rows. Only running
+                statistics and a decimated series of at most 'maxPoints'
+                points are kept in memory
+            lazy (True|False): Only fetch the metadata of a probe station PID.
+                The data points are fetched on first access and kept
 
         """
+        self.__columnar = columnar
+        self.__dtype = np.dtype(dtype)
+        self.__layout = columns
+        self.__streamStats = None
+        self.__pending = None
+        self.__lastUID = None
+        self.__derived = {}
+        self.__stats = None
+
+        if columns is not None and \
+           not all(col in self.__columns for col in columns):
+            raise ValueError("Unknown column in %s" %(str(columns)))
+
         self.__id = None
         self.__name = None
 
@@ -53,6 +121,10 @@ class KITData(object):
         self.__t0 = None
         self.__h0 = None
 
+        self.__Fp = None
+        self.__Fn = None
+        self.__project = None
+
         self.__RPunchDict = None
         self.__credentials = credentials
 
@@ -82,83 +154,69 @@ class KITData(object):
                 self.__init_db_connection(credentials)
 
             # Distinguish between probe station and ALiBaVa ID
-            if measurement is "alibava":
+            if measurement == "alibava":
                 if show_input is not False:
                     print("Input: ALiBaVa run")
                 else:
                     pass
                 self.__allo_db_alibava(dataInput)
-            elif measurement is "probe" and show_input is not False:
+            elif measurement == "probe":
                 if show_input is not False:
                     print("Input: Probe station PID")
                 else:
                     pass
-                self.__allo_db(dataInput)
-
-        # Check if dataInput is a file
-        elif isinstance(dataInput, str) and os.path.isfile(dataInput):
+                if stream:
+                    self.__allo_db_stream(dataInput, chunksize, maxPoints)
+                else:
+                    self.__allo_db(dataInput, lazy)
 
-            print("Input: File: " + dataInput)
+        # Probe station measurement that was already fetched from the database
+        elif isinstance(dataInput, dict):
+            if show_input is not False:
+                print("Input: Probe station PID")
+            self.__id = dataInput["PID"]
+            self.__allo_db_data(dataInput)
+            self.__allo_db_info(dataInput)
 
-            with open(dataInput, 'r') as inputFile:
-                for line in inputFile:
-                    splited = line.split();
-
-                    try:
-                        # First two columns are always interpreted as x and y
-                        self.__x.append(float(splited[0]))
-                        self.__y.append(float(splited[1]))
-
-                        # Three columns are seen as x,y,z
-                        if len(splited) == 3:
-                            self.__z.append(float(splited[2]))
-                        # Four columns represent x,y and their errors dx,dy
-                        elif len(splited) == 4:
-                            self.__dx.append(float(splited[2]))
-                            self.__dy.append(float(splited[3]))
-                        # Six column are seen as x,y,z and their errors dx,dy,dz
-                        elif len(splited) == 6:
-                            self.__z.append(float(splited[2]))
-                            self.__dx.append(float(splited[3]))
-                            self.__dy.append(float(splited[4]))
-                            self.__dz.append(float(splited[5]))
-                        # Rpunch measurement from file
-                        elif len(splited) > 6 and "REdge" in dataInput:
-                            self.__z.append(float(splited[2]))
-                    except:
-                        pass
+        # Binary archive written by KITData.save
+        elif isinstance(dataInput, str) and os.path.isfile(dataInput) \
+             and dataInput.endswith(".kit"):
 
-                # Reorder variables if file contains a RPunch measurement
-                if self.checkRpunch(self.__x):
+            print("Input: Archive: " + dataInput)
+            self.load(dataInput)
 
-                    dic = OrderedDict()
-                    bias = self.__x[0]
-                    ix = []
-                    iy = []
+        # Check if dataInput is a file
+        elif isinstance(dataInput, str) and os.path.isfile(dataInput):
 
-                    # Rpunch Ramps: x = V_bias, y = V_edge, z = I_edge
-                    for (valX, valY, valZ) in zip(self.__x, self.__y, self.__z):
-                        # create the IV keys for one bias voltage
-                        if bias == valX:
-                            ix.append(valY)
-                            iy.append(valZ)
-                        else:
-                            dic[bias] = zip(ix,iy)
-                            bias = valX
-                            ix = [valY]
-                            iy = [valZ]
+            print("Input: File: " + dataInput)
 
-                    dic[bias] = zip(ix,iy)
+            # Detect column layout once and parse the whole table at once
+            if stream:
+                layout, table = self.__readStream(dataInput, chunksize,
+                                                  maxPoints)
+            elif cache:
+                layout, table = self.__readCachedFile(dataInput)
+            else:
+                layout, table = self.__readFile(dataInput)
+            for i, col in enumerate(layout):
+                if self.__columnar:
+                    self.__setColumn(col, table[i])
+                else:
+                    self.__setColumn(col, table[i].tolist())
 
-                    self.__RPunchDict = dic
+            # Reorder variables if file contains a RPunch measurement
+            if self.checkRpunch(self.__x):
+                # Rpunch Ramps: x = V_bias, y = V_edge, z = I_edge
+                self.__RPunchDict = kitutils.splitRamp(self.__x, self.__y,
+                                                       self.__z)
 
-                else:
-                    self.__name = os.path.basename(dataInput).split(".")[0]
-                    for char in os.path.basename(dataInput):
-                        if char == "-":
-                            self.__name = os.path.basename(dataInput).split("-")[0]
-                        else:
-                            pass
+            else:
+                self.__name = os.path.basename(dataInput).split(".")[0]
+                for char in os.path.basename(dataInput):
+                    if char == "-":
+                        self.__name = os.path.basename(dataInput).split("-")[0]
+                    else:
+                        pass
 
 
         # Data input contains list of KITData objects
@@ -211,23 +269,532 @@ class KITData(object):
             raise OSError("Input could not be identified (Input: %s)"
                           %(dataInput))
 
+        # Convert all columns into typed arrays once everything is loaded
+        if self.__columnar and self.__pending is None:
+            for col in self.__columns:
+                self.__setColumn(col, self.__getColumn(col))
+
+        # Summary of all columns that is kept up to date by stats()
+        if self.__pending is None:
+            self.__updateStats()
+
+
+    def __getColumn(self, name):
+        if self.__pending is not None:
+            self.__loadPending()
+        return getattr(self, "_KITData__" + name)
+
+    def __setColumn(self, name, values):
+        """Store a measurement column. In columnar mode the values are
+        converted into a contiguous array of the configured data type.
+
+        Args:
+            name: name of the column (see KITData.__columns)
+            values: list or array with one entry per data point
+
+        """
+
+        if self.__pending is not None:
+            self.__loadPending()
+
+        # Every change of a column outdates the derived quantities
+        self.__derived.clear()
+        self.__stats = None
+
+        if self.__columnar:
+            if name == "time":
+                values = self.__toTime(values)
+            else:
+                values = np.ascontiguousarray(values, dtype=self.__dtype)
+        setattr(self, "_KITData__" + name, values)
+
+
+    def __toTime(self, values):
+        """Convert a time column into a contiguous datetime64[us] array. Time
+        columns read from files are given in seconds (unix time), NaN
+        becomes NaT.
+
+        Args:
+            values: list or array of datetimes or unix seconds
+
+        """
+
+        values = np.asarray(values)
+        if values.dtype.kind not in "iuf":
+            return np.ascontiguousarray(values, dtype="datetime64[us]")
+
+        seconds = values.astype(float)
+        time = np.full(len(seconds), np.datetime64("NaT"),
+                       dtype="datetime64[us]")
+        valid = np.isfinite(seconds)
+        time[valid] = np.round(seconds[valid] * 1e6).astype("int64")\
+            .astype("datetime64[us]")
+        return time
+
+
+    def __getLayout(self, fileName, nCols):
+        """Returns the names of the columns that are read from a data file
+
+        Args:
+            fileName: name of the data file
+            nCols: number of columns in the data table
+
+        """
+
+        if self.__layout is not None:
+            return tuple(self.__layout)
+        # Rpunch measurement from file: x = V_bias, y = V_edge, z = I_edge
+        if nCols > 6 and "REdge" in fileName:
+            return ("x", "y", "z")
+        # First two columns are always interpreted as x and y
+        return self.__fileLayouts.get(nCols, ("x", "y"))
+
+
+    def __readFile(self, fileName):
+        """Parse a data file with one data point per row. The column layout
+        is determined once from the first numeric row, leading header lines
+        are skipped and the rest of the file is parsed in a single call.
+
+        Args:
+            fileName: name of the data file
+
+        Returns:
+            tuple(layout, table): names of the columns and a 2D array with
+                one row per name in layout and one column per data point
+
+        """
+
+        header, nCols = self.__scanHeader(fileName)
+
+        # File without any data
+        if nCols is None:
+            layout = self.__getLayout(fileName, 2)
+            return layout, np.empty((len(layout), 0))
+
+        layout = self.__getLayout(fileName, nCols)
+
+        try:
+            table = np.loadtxt(fileName, skiprows=header, comments="#",
+                               usecols=range(len(layout)), ndmin=2)
+        except ValueError as err:
+            raise ValueError("Malformed data in file %s (expected %i columns "
+                             "per row after %i header lines): %s"
+                             %(fileName, nCols, header, err))
+
+        return layout, np.ascontiguousarray(table.T)
+
+
+    def __openFile(self, fileName):
+        """Open a (.gz/.xz compressed) text file for reading"""
+
+        if fileName.endswith(".gz"):
+            return gzip.open(fileName, 'rt')
+        elif fileName.endswith(".xz"):
+            return lzma.open(fileName, 'rt')
+        return open(fileName, 'r')
+
+
+    def __scanHeader(self, fileName):
+        """Find the first row with numeric data in a data file
+
+        Args:
+            fileName: name of the data file
+
+        Returns:
+            tuple(header, nCols): number of leading header lines and number of
+                columns of the first numeric row (None if there is none)
+
+        """
+
+        header = 0
+
+        with self.__openFile(fileName) as inputFile:
+            for line in inputFile:
+                splited = line.split()
+                try:
+                    [float(val) for val in splited]
+                except ValueError:
+                    splited = []
+                if len(splited) >= 2:
+                    return header, len(splited)
+                header += 1
+
+        return header, None
+
+
+    def readChunks(self, fileName, chunksize=100000):
+        """Generator that parses a (.gz/.xz compressed) data file in chunks of
+        at most chunksize rows. Header lines are skipped.
+
+        Args:
+            fileName: name of the data file
+            chunksize: number of rows per chunk
+
+        Yields:
+            tuple(layout, table): names of the columns and a 2D array with
+                one row per name in layout and one column per data point
+
+        """
+
+        header, nCols = self.__scanHeader(fileName)
+        if nCols is None:
+            return
+
+        layout = self.__getLayout(fileName, nCols)
+
+        with self.__openFile(fileName) as inputFile:
+            for line in itertools.islice(inputFile, header):
+                pass
+            row = header
+            while True:
+                lines = list(itertools.islice(inputFile, chunksize))
+                if len(lines) == 0:
+                    break
+                try:
+                    table = np.loadtxt(lines, comments="#", ndmin=2,
+                                       usecols=range(len(layout)))
+                except ValueError as err:
+                    raise ValueError("Malformed data in file %s between line "
+                                     "%i and %i: %s"
+                                     %(fileName, row + 1, row + len(lines),
+                                       err))
+                row += len(lines)
+                yield layout, table.T
+
+
+    def __readStream(self, fileName, chunksize, maxPoints):
+        """Read a data file chunk by chunk while keeping running statistics
+        (count, min, max, mean) of every column and a decimated series. The
+        decimation step is doubled whenever more than maxPoints points are
+        kept, so memory stays bounded by maxPoints plus one chunk.
+
+        Args:
+            fileName: name of the data file
+            chunksize: number of rows per chunk
+            maxPoints: maximum number of points of the decimated series
+
+        Returns:
+            tuple(layout, table): see __readFile
+
+        """
+
+        return self.__decimate(self.readChunks(fileName, chunksize),
+                               self.__getLayout(fileName, 2), maxPoints)
+
+
+    def __decimate(self, chunks, layout, maxPoints):
+        """Consume (layout, table) chunks and keep running statistics and a
+        decimated series (see __readStream)
+
+        Args:
+            chunks: iterable of (layout, table) with one row per column
+            layout: column names used if there are no chunks at all
+            maxPoints: maximum number of points of the decimated series
+
+        Returns:
+            tuple(layout, table): see __readFile
+
+        """
+
+        kept = np.empty((len(layout), 0))
+        keptIdx = np.empty(0, dtype="int64")
+        step = 1
+        offset = 0
+        count = None
+
+        for layout, table in chunks:
+            # chunks of only blank or comment lines carry no data points
+            if table.shape[1] == 0:
+                continue
+            if count is None:
+                kept = np.empty((len(layout), 0))
+                count = np.zeros(len(layout), dtype="int64")
+                total = np.zeros(len(layout))
+                low = np.full(len(layout), np.inf)
+                high = np.full(len(layout), -np.inf)
+
+            finite = np.isfinite(table)
+            count += finite.sum(axis=1)
+            total += np.where(finite, table, 0).sum(axis=1)
+            low = np.fmin(low, np.where(finite, table, np.inf).min(axis=1))
+            high = np.fmax(high, np.where(finite, table, -np.inf).max(axis=1))
+
+            idx = np.arange(offset, offset + table.shape[1])
+            sel = idx % step == 0
+            kept = np.concatenate((kept, table[:, sel]), axis=1)
+            keptIdx = np.concatenate((keptIdx, idx[sel]))
+            offset += table.shape[1]
+
+            while len(keptIdx) > maxPoints:
+                step *= 2
+                sel = keptIdx % step == 0
+                kept = kept[:, sel]
+                keptIdx = keptIdx[sel]
+
+        if count is None:
+            count = np.zeros(len(layout), dtype="int64")
+
+        self.__streamStats = OrderedDict()
+        for i, col in enumerate(layout):
+            self.__streamStats[col] = {
+                "count" : int(count[i]),
+                "min"   : float(low[i]) if count[i] else None,
+                "max"   : float(high[i]) if count[i] else None,
+                "mean"  : float(total[i] / count[i]) if count[i] else None}
+        self.__streamStats["rows"] = offset
+        self.__streamStats["step"] = step
+
+        return layout, np.ascontiguousarray(kept)
+
+
+    def __readCachedFile(self, fileName):
+        """Same as __readFile, but the parsed table is stored as .npy file in
+        a '.kitcache' folder next to the data file. The cache entry is keyed
+        by path, size and modification time of the file and is memory-mapped
+        on later loads. Stale entries of the same file are removed.
+
+        Args:
+            fileName: name of the data file
+
+        Returns:
+            tuple(layout, table): see __readFile
+
+        """
+
+        path = os.path.abspath(fileName)
+        stat = os.stat(path)
+        key = hashlib.sha1(("%s|%i|%i|%s" %(path, stat.st_size,
+                                            stat.st_mtime_ns, self.__layout))
+                           .encode()).hexdigest()[:16]
+
+        cacheDir = os.path.join(os.path.dirname(path), ".kitcache")
+        prefix = os.path.basename(path) + "."
+        cacheFile = os.path.join(cacheDir, prefix + key + ".npy")
+
+        if os.path.isfile(cacheFile):
+            try:
+                table = np.load(cacheFile, mmap_mode="r")
+                return self.__getLayout(fileName, len(table)), table
+            except (OSError, ValueError):
+                pass
+
+        layout, table = self.__readFile(fileName)
+
+        # The cache is optional, a read-only data folder is not an error
+        try:
+            os.makedirs(cacheDir, exist_ok=True)
+            for entry in os.listdir(cacheDir):
+                stem = entry[len(prefix):]
+                if entry.startswith(prefix) and stem.endswith(".npy") \
+                   and "." not in stem[:-4]:
+                    os.remove(os.path.join(cacheDir, entry))
+            np.save(cacheFile + ".tmp.npy", table)
+            os.replace(cacheFile + ".tmp.npy", cacheFile)
+        except OSError:
+            pass
+
+        return layout, table
+
+
+    def save(self, fileName):
+        """Write all columns and the metadata into a binary archive that can
+        be read without database connection. The archive starts with a JSON
+        header followed by the raw columns, each aligned to 64 bytes, so
+        they can be memory-mapped by KITData.load.
+
+        Args:
+            fileName: name of the archive (usually ending with '.kit')
+
+        Returns:
+            True
+
+        """
+
+        meta = {"id"        : self.__id,
+                "name"      : self.__name,
+                "paraX"     : self.__px,
+                "paraY"     : self.__py,
+                "paraZ"     : self.__pz,
+                "t0"        : self.__t0,
+                "h0"        : self.__h0,
+                "Fp"        : self.__Fp,
+                "Fn"        : self.__Fn,
+                "project"   : self.__project,
+                "gain"      : self.__gain,
+                "seed"      : self.__seed,
+                "seederr"   : self.__seederr}
+
+        arrays = OrderedDict()
+        for col in self.__columns:
+            if col == "time":
+                arrays[col] = self.__toTime(self.__getColumn(col))
+            else:
+                arrays[col] = np.asarray(self.__getColumn(col),
+                                         dtype=self.__dtype)
+
+        # Offsets are relative to the end of the header
+        columns = OrderedDict()
+        offset = 0
+        for col, values in arrays.items():
+            columns[col] = {"dtype"  : values.dtype.str,
+                            "size"   : len(values),
+                            "offset" : offset}
+            offset += -(-values.nbytes // self.__archiveAlign) \
+                      * self.__archiveAlign
+
+        header = json.dumps({"meta" : meta, "columns" : columns},
+                            default=lambda obj: obj.item()
+                            if isinstance(obj, np.generic) else str(obj))
+        header = header.encode("utf-8")
+        start = len(self.__archiveMagic) + 8 + len(header)
+        header += b" " * (-start % self.__archiveAlign)
+
+        with open(fileName, 'wb') as outputFile:
+            outputFile.write(self.__archiveMagic)
+            outputFile.write(struct.pack("<Q", len(header)))
+            outputFile.write(header)
+            for col, values in arrays.items():
+                outputFile.write(np.ascontiguousarray(values).tobytes())
+                outputFile.write(b"\0" * (-values.nbytes
+                                           % self.__archiveAlign))
+
+        return True
+
+
+    def load(self, fileName, mmap=True):
+        """Read columns and metadata from a binary archive that was written by
+        KITData.save
+
+        Args:
+            fileName: name of the archive
+            mmap (True|False): memory-map the columns instead of reading them
+
+        Returns:
+            True
+
+        """
+
+        with open(fileName, 'rb') as inputFile:
+            if inputFile.read(len(self.__archiveMagic)) != self.__archiveMagic:
+                raise ValueError("%s is not a KITData archive" %(fileName))
+            length = struct.unpack("<Q", inputFile.read(8))[0]
+            header = json.loads(inputFile.read(length).decode("utf-8"))
+        start = len(self.__archiveMagic) + 8 + length
+
+        meta = header["meta"]
+        self.__id = meta["id"]
+        self.__name = meta["name"]
+        self.__px = meta["paraX"]
+        self.__py = meta["paraY"]
+        self.__pz = meta["paraZ"]
+        self.__t0 = meta["t0"]
+        self.__h0 = meta["h0"]
+        self.__Fp = meta["Fp"]
+        self.__Fn = meta["Fn"]
+        self.__project = meta["project"]
+        self.__gain = meta["gain"]
+        self.__seed = meta["seed"]
+        self.__seederr = meta["seederr"]
+
+        # one mapping of the data region per archive, the columns are views
+        # into it so that only a single file descriptor is kept open
+        buf = None
+        for col, info in header["columns"].items():
+            dtype = np.dtype(info["dtype"])
+            if info["size"] == 0:
+                values = np.empty(0, dtype=dtype)
+            elif mmap:
+                if buf is None:
+                    buf = np.memmap(fileName, dtype=np.uint8, mode="r",
+                                    offset=start)
+                values = np.ndarray(shape=(info["size"],), dtype=dtype,
+                                    buffer=buf, offset=info["offset"])
+            else:
+                values = np.fromfile(fileName, dtype=dtype,
+                                     count=info["size"],
+                                     offset=start + info["offset"])
+            if self.__columnar:
+                self.__setColumn(col, values)
+            else:
+                self.__setColumn(col, values.tolist())
+
+        return True
+
 
     def getRPunchDict(self):
         return self.__RPunchDict
 
     def checkRpunch(self, List):
+        """Checks if the first x value appears more than twice, which is the
+        case for RPunch ramps (x = V_bias)
+
+        """
+
+        values = np.asarray(List)
+        if len(values) == 0:
+            return False
+        return bool(np.count_nonzero(values == values[0]) > 2)
+
+    @classmethod
+    def fromPIDs(cls, pids, credentials='db.cfg', **kwargs):
+        """Create KITData objects for many probe station PIDs. All PIDs are
+        fetched with a few bulk queries instead of one query set per PID.
+
+        Args:
+            pids: list of probe IDs
+            credentials (str): database credentials file
+            kwargs: passed on to KITData, e.g. columnar=True
+
+        Returns:
+            list of KITData objects in the order of pids (unknown PIDs are
+            left out)
+
+        """
+
+        if cls.dbSession is None:
+            KITData().__init_db_connection(credentials)
+
+        pids = [int(pid) for pid in pids]
+        results = cls.dbSession.probe_search_for_PIDs(pids)
+
+        return [cls(results[pid], **kwargs) for pid in pids if pid in results]
+
+    @classmethod
+    def fromProject(cls, project=None, names=None, paraY=None,
+                    credentials='db.cfg', **kwargs):
+        """Create KITData objects for all probe station measurements of a
+        project, a list of sensors and/or a measured quantity. Everything is
+        fetched with a few set-based queries (see fromPIDs).
+
+        Args:
+            project (None|str): project of the sensors
+            names (None|list): sensor names
+            paraY (None|str|list): measured quantity, e.g. "I_tot"
+            credentials (str): database credentials file
+            kwargs: passed on to KITData, e.g. columnar=True
+
+        Returns:
+            list of KITData objects ordered by PID
+
+        """
+
+        if cls.dbSession is None:
+            KITData().__init_db_connection(credentials)
+
+        results = cls.dbSession.probe_search_for_project(project, names,
+                                                         paraY)
+
+        return [cls(data, **kwargs) for data in results.values()]
 
-        for val in List:
-            if List.count(val) > 2:
-                return True
-            else:
-                return False
 
     def __init_db_connection(self, credentials='db.cfg', section='database'):
         """Initialize db_connection and set static connection and curser
 
         Args:
-            filename: database config file that contains all necessary data
+            filename: database config file that contains all necessary data.
+                An optional "cache" entry names a local cache file
+                and "workers" the number of concurrent fetch threads. A
+                "trace" entry names a JSON lines file of all queries
             section: config section where login data can be found
 
         """
@@ -239,7 +806,10 @@ class KITData(object):
             raise ValueError("No credentials file found. Please add correct"+
                              "database parameters to 'db.cfg'")
         try:
-            KITData.dbSession = KITSearch(db_config)
+            KITData.dbSession = KITSearch(db_config,
+                                          cache=db_config.get("cache"),
+                                          workers=db_config.get("workers", 1),
+                                          trace=db_config.get("trace"))
             print("Database connection established")
         except:
             raise ValueError("Database connection failed.")
@@ -280,25 +850,68 @@ class KITData(object):
                 return False
 
 
-    def __allo_db(self, pid):
+    def __allo_db(self, pid, lazy=False):
         """Allocate measurement information.
            This works only if database connection is already established.
 
         Args:
             pid: probe id in the IEKP database
+            lazy (True|False): only allocate the metadata and postpone
+                fetching the data points until they are accessed
+
+        """
+
+        if lazy:
+            data = KITData.dbSession.probe_search_for_info(pid)
+            self.__pending = pid
+        else:
+            data = KITData.dbSession.probe_search_for_PID(pid)
+            self.__allo_db_data(data)
+
+        self.__allo_db_info(data)
+
+
+    def __allo_db_stream(self, pid, chunksize, maxPoints):
+        """Allocate a probe station measurement whose data points are
+        streamed from the database and decimated like a streamed file
+
+        Args:
+            pid: probe id in the IEKP database
+            chunksize: number of rows per chunk
+            maxPoints: maximum number of points of the decimated series
 
         """
 
-        data = KITData.dbSession.search_for_PID(pid)
+        keys = self.__dbColumns
+        layout = tuple(col for (col, key) in keys)
+
+        def chunks():
+            for chunk in KITData.dbSession.probe_iter_data(pid, chunksize):
+                # time is decimated as float seconds
+                time = chunk["time"]
+                seconds = np.where(np.isnat(time), np.nan,
+                                   time.astype("int64") / 1e6)
+                yield layout, np.vstack([chunk[key].astype(float)
+                                         for (col, key) in keys[:-1]]
+                                        + [seconds])
+
+        layout, table = self.__decimate(chunks(), layout, maxPoints)
+
+        data = {key : table[i] for i, (col, key) in enumerate(keys)}
+        data["time"] = self.__toTime(table[-1])
+
+        self.__allo_db_data(data)
+        self.__allo_db_info(KITData.dbSession.probe_search_for_info(pid))
+
+
+    def __allo_db_info(self, data):
+        """Allocate the metadata of a probe station measurement
+
+        Args:
+            data: dictionary returned by KITSearch.probe_search_for_info
+
+        """
 
-        self.__x = data["dataX"]
-        self.__y = data["dataY"]
-        self.__z = data["dataZ"]
-        self.__temp = data["temp"]
-        self.__humid = data["rh"]
-        self.__err = data["err"]
-        self.__bias_current = data["bias_cur"]
-        self.__time = data["time"]
         self.__px = data["paraX"]
         self.__py = data["paraY"]
         self.__t0 = data["t0"]
@@ -309,6 +922,83 @@ class KITData(object):
         self.__project = data["project"]
 
 
+    def __allo_db_data(self, data):
+        """Allocate the data points of a probe station measurement
+
+        Args:
+            data: dictionary returned by KITSearch.probe_search_for_data
+                with one list or array per column
+
+        """
+
+        for col, key in self.__dbColumns:
+            values = data[key]
+            # KITSearch delivers arrays, list mode keeps python lists
+            if isinstance(values, np.ndarray) and not self.__columnar:
+                values = values.tolist()
+            self.__setColumn(col, values)
+
+        # highest probe_uid of the fetched rows, needed by refresh
+        self.__lastUID = data.get("lastUID")
+
+
+    def __loadPending(self):
+        """Fetch the data points of a lazily initialized PID"""
+
+        pid = self.__pending
+        self.__pending = None
+        self.__allo_db_data(KITData.dbSession.probe_search_for_data(pid))
+        self.__updateStats()
+
+
+    def isLoaded(self):
+        """Returns False as long as the data points of a lazily initialized
+        PID have not been fetched yet
+        """
+        return self.__pending is None
+
+
+    def refresh(self):
+        """Append the data points that were added to the database since the
+        PID was loaded. Only rows behind the last known probe_uid are
+        fetched, so updating a running measurement costs just the new points.
+
+        Returns:
+            int: number of new data points
+
+        """
+
+        if self.__id is None or self.__gain is not None \
+           or self.__streamStats is not None:
+            raise ValueError("Only probe station PIDs that are not streamed "
+                             "can be refreshed")
+
+        if KITData.dbSession is None:
+            self.__init_db_connection(self.__credentials)
+        if self.__pending is not None:
+            self.__loadPending()
+        if self.__lastUID is None and len(self.__x) != 0:
+            raise ValueError("The database rows of the loaded data points "
+                             "are unknown. Load the PID from the database "
+                             "to refresh it")
+
+        data, self.__lastUID = KITData.dbSession.probe_search_for_tail(
+            self.__id, self.__lastUID)
+        new = len(data["dataX"])
+        if new == 0:
+            return 0
+
+        for col, key in self.__dbColumns:
+            if self.__columnar:
+                values = np.concatenate((self.__getColumn(col), data[key]))
+            else:
+                values = list(self.__getColumn(col)) + data[key].tolist()
+            self.__setColumn(col, values)
+        self.__updateStats()
+
+        return new
+
+
     def __allo_db_alibava(self, run):
 
         self.__px = "Voltage"
@@ -317,7 +1007,7 @@ class KITData(object):
         self.__name = "ALiBaVa"
         self.__project = "Default_Project"
 
-        data = KITData.dbSession.search_for_run(run)
+        data = KITData.dbSession.ali_search_for_run(run)
 
         self.__x = [data["voltage"]]
         self.__y = [data["e_sig"]]
@@ -331,54 +1021,118 @@ class KITData(object):
         self.__Fn = data["Fn"]
         self.__project = data["project"]
 
-    def dropXLower(self, xlow=0):
-        """Drops datasets if x < xlow
+    def getMask(self, **limits):
+        """Build a single boolean mask over all data points. Every keyword
+        refers to a column (x, y, z, dx, dy, dz, temp, humid, err,
+        bias_current, time) and all conditions are combined with 'and'.
+        Masks can be combined further with '&', '|' and '~'.
 
         Args:
-            xlow: everything below xlow will be droped
+            limits (column=(low, high)|column=callable): keep points with
+                low <= value <= high, None leaves a side open. A callable
+                gets the column as array and has to return a boolean array
+
+        Returns:
+            boolean array with one entry per data point
+
+        Example:
+            mask = data.getMask(x=(0, 500), temp=lambda t: t < 20)
+
+        """
+
+        mask = np.ones(self.getSize(), dtype=bool)
+
+        for col, limit in limits.items():
+            if col not in self.__columns:
+                raise ValueError("Unknown column '%s'" %(col))
+
+            values = np.asarray(self.__getColumn(col))
+            if len(values) != len(mask):
+                raise ValueError("Column '%s' contains %i instead of %i values"
+                                 %(col, len(values), len(mask)))
+
+            if callable(limit):
+                mask &= np.asarray(limit(values), dtype=bool)
+            else:
+                low, high = limit
+                if low is not None:
+                    mask &= values >= low
+                if high is not None:
+                    mask &= values <= high
+
+        return mask
+
+
+    def applyMask(self, mask):
+        """Drops every data point where mask is False. The mask is applied to
+        all columns at once, so x, y, z, errors, temperature, humidity and
+        time stay in sync.
+
+        Args:
+            mask: boolean array with one entry per data point
 
         Returns:
             True
 
         """
 
-        xTemp = []
-        yTemp = []
+        mask = np.asarray(mask, dtype=bool)
+        size = self.getSize()
 
-        for i,x in enumerate(self.__x):
-            if x >= float(xlow):
-                xTemp.append(x)
-                yTemp.append(self.__y[i])
+        if len(mask) != size:
+            raise ValueError("Mask contains %i instead of %i values"
+                             %(len(mask), size))
 
-        self.__x = xTemp
-        self.__y = yTemp
+        for col in self.__columns:
+            values = self.__getColumn(col)
+            # Columns that are not filled (e.g. no errors) are left untouched
+            if len(values) != size:
+                continue
+            if self.__columnar:
+                self.__setColumn(col, values[mask])
+            else:
+                self.__setColumn(col, np.asarray(values)[mask].tolist())
 
         return True
 
 
-    def dropXHigher(self, xhigh=0):
-        """Drops datasets if x > xhigh
+    def dropRange(self, **limits):
+        """Drops every data point outside the given limits. See getMask.
+
+        Returns:
+            True
+
+        """
+
+        return self.applyMask(self.getMask(**limits))
+
+
+    def dropXLower(self, xlow=0):
+        """Drops datasets if x < xlow
 
         Args:
-            xhigh: everything above xhigh will be droped
+            xlow: everything below xlow will be droped
 
         Returns:
             True
 
         """
 
-        xTemp = []
-        yTemp = []
+        return self.dropRange(x=(float(xlow), None))
+
+
+    def dropXHigher(self, xhigh=0):
+        """Drops datasets if x > xhigh
+
+        Args:
+            xhigh: everything above xhigh will be droped
 
-        for i,x in enumerate(self.__x):
-            if x <= float(xhigh):
-                xTemp.append(x)
-                yTemp.append(self.__y[i])
+        Returns:
+            True
 
-        self.__x = xTemp
-        self.__y = yTemp
+        """
 
-        return True
+        return self.dropRange(x=(None, float(xhigh)))
 
 
     def dropYLower(self, ylow=0):
@@ -392,18 +1146,7 @@ class KITData(object):
 
         """
 
-        xTemp = []
-        yTemp = []
-
-        for i,y in enumerate(self.__y):
-            if y >= float(ylow):
-                xTemp.append(self.__x[i])
-                yTemp.append(y)
-
-        self.__x = xTemp
-        self.__y = yTemp
-
-        return True
+        return self.dropRange(y=(float(ylow), None))
 
 
     def dropYHigher(self, yhigh=0):
@@ -417,18 +1160,7 @@ class KITData(object):
 
         """
 
-        xTemp = []
-        yTemp = []
-
-        for i,y in enumerate(self.__y):
-            if y <= float(yhigh):
-                xTemp.append(self.__x[i])
-                yTemp.append(y)
-
-        self.__x = xTemp
-        self.__y = yTemp
-
-        return True
+        return self.dropRange(y=(None, float(yhigh)))
 
 
     def setRange(self, var="x", low=0, high=0):
@@ -442,18 +1174,161 @@ class KITData(object):
 
         """
 
-        if var is "x":
-            self.dropXLower(low)
-            self.dropXHigher(high)
-        elif var is "y":
-            self.dropYLower(low)
-            self.dropYHigher(high)
+        if var in ["x", "y"]:
+            self.dropRange(**{var : (float(low), float(high))})
 
         return True
 
 
+    def derive(self, column, *steps):
+        """Returns a derived quantity of a column, e.g. its absolute values or
+        1/C^2. The result is cached per object and is recomputed only after
+        the data has changed (set methods, drop methods, masks).
+
+        Args:
+            column: name of the column (see getColumn)
+            steps: transformations that are applied one after another.
+                Either a name ("abs", "invsquare") or a tuple of a name and
+                its parameters (("scale", factor))
+
+        Returns:
+            read-only array of the derived quantity
+
+        Example:
+            y = data.derive("y", "abs", ("scale", 7.59))
+
+        """
+
+        steps = tuple(step if isinstance(step, tuple) else (step,)
+                      for step in steps)
+        key = (column,) + steps
+
+        if key not in self.__derived:
+            values = np.asarray(self.getColumn(column), dtype=float)
+            for step in steps:
+                if step[0] not in self.__transforms:
+                    raise ValueError("Unknown transformation '%s'" %(step[0]))
+                values = self.__transforms[step[0]](values, *step[1:])
+            values = np.array(values, dtype=float)
+            values.setflags(write=False)
+            self.__derived[key] = values
+
+        return self.__derived[key]
+
+
+    def __updateStats(self):
+        """Compute the summary of every filled column (see stats)"""
+
+        self.__stats = OrderedDict()
+
+        for col in self.__columns:
+            values = self.__getColumn(col)
+            if len(values) == 0:
+                continue
+
+            if col == "time":
+                values = self.__toTime(values)
+                valid = values[~np.isnat(values)]
+                self.__stats[col] = {
+                    "count" : len(values),
+                    "nan"   : len(values) - len(valid),
+                    "min"   : valid.min() if len(valid) else None,
+                    "max"   : valid.max() if len(valid) else None}
+                continue
+
+            values = np.asarray(values, dtype=float)
+            valid = values[~np.isnan(values)]
+            summary = {"count"  : len(values),
+                       "nan"    : len(values) - len(valid)}
+            if len(valid):
+                p05, p25, p50, p75, p95 = np.percentile(valid,
+                                                        [5, 25, 50, 75, 95])
+                summary.update({"min"    : float(valid.min()),
+                                "max"    : float(valid.max()),
+                                "mean"   : float(valid.mean()),
+                                "std"    : float(valid.std()),
+                                "p05"    : float(p05),
+                                "p25"    : float(p25),
+                                "median" : float(p50),
+                                "p75"    : float(p75),
+                                "p95"    : float(p95)})
+            else:
+                summary.update(dict.fromkeys(["min", "max", "mean", "std",
+                                              "p05", "p25", "median", "p75",
+                                              "p95"]))
+            self.__stats[col] = summary
+
+
+    def stats(self, column=None):
+        """Returns the summary of the data that is computed at load time and
+        recomputed after the data has changed. Numeric columns contain count,
+        nan, min, max, mean, std, median and the 5/25/75/95 percentiles,
+        time only contains count, nan, min and max. NaNs are ignored.
+
+        Args:
+            column (None|str): name of a single column (see getColumn)
+
+        Returns:
+            dict of the column or OrderedDict with all filled columns
+
+        """
+
+        if self.__stats is None:
+            self.__updateStats()
+
+        if column is None:
+            return self.__stats
+        if column not in self.__columns:
+            raise ValueError("Unknown column '%s'" %(column))
+        if column not in self.__stats:
+            raise ValueError("Column '%s' is empty" %(column))
+
+        return self.__stats[column]
+
+
+    def fit(self, deg=1, x="x", y="y"):
+        """Returns the coefficients of a polynomial fit of y over x. The fit
+        is cached like the results of KITData.derive.
+
+        Args:
+            deg: degree of the polynomial
+            x: column used as x values
+            y: column used as y values
+
+        Returns:
+            array of polynomial coefficients, highest power first
+
+        """
+
+        key = ("fit", x, y, deg)
+
+        if key not in self.__derived:
+            coeffs = np.polyfit(np.asarray(self.getColumn(x), dtype=float),
+                                np.asarray(self.getColumn(y), dtype=float),
+                                deg)
+            coeffs.setflags(write=False)
+            self.__derived[key] = coeffs
+
+        return self.__derived[key]
+
+
+    def getStreamStats(self):
+        """Returns the running statistics of a streamed file
+
+        Returns:
+            OrderedDict: count, min, max and mean of every column of the full
+                file as well as the number of rows and the decimation step
+                or None if the file was not streamed
+
+        """
+
+        return self.__streamStats
+
+    def isColumnar(self):
+        return self.__columnar
+
     def includesErrors(self):
-        return True if len(self.__dx) != 0 else False
+        return True if len(self.__getColumn("dx")) != 0 else False
 
 
     ###################
@@ -474,7 +1349,7 @@ class KITData(object):
 
         if inputArray is not None:
             try:
-                self.__x = inputArray
+                self.__setColumn("x", inputArray)
                 return True
             except:
                 print("Cannot set x: wrong format")
@@ -494,7 +1369,7 @@ class KITData(object):
 
         if inputArray is not None:
             try:
-                self.__y = inputArray
+                self.__setColumn("y", inputArray)
                 return True
             except:
                 print("Cannot set y: wrong format")
@@ -515,7 +1390,7 @@ class KITData(object):
 
         if inputArray is not None:
             try:
-                self.__z = inputArray
+                self.__setColumn("z", inputArray)
                 return True
             except:
                 print("Cannot set z: wrong format")
@@ -607,12 +1482,32 @@ class KITData(object):
         """
 
         if (str(dataSet) == "x") | (dataSet == 0) :
-            return self.__x
+            return self.__getColumn("x")
         elif (str(dataSet) == "y") | (dataSet == 1) :
-            return self.__y
+            return self.__getColumn("y")
         else:
             return []
 
+    def getColumn(self, name, asarray=False):
+        """Returns any measurement column as list or array
+
+        Args:
+            name: x, y, z, dx, dy, dz, temp, humid, err, bias_current or time
+            asarray (True|False): dataset will be returned as
+                array(True) or list(false)
+
+        Returns:
+            list or array of the column
+
+        """
+
+        if name not in self.__columns:
+            raise ValueError("Unknown column '%s'" %(name))
+        if asarray or self.__columnar:
+            return np.asarray(self.__getColumn(name))
+        else:
+            return self.__getColumn(name)
+
     def getRun(self):
         """Returns PID or Run number
 
@@ -646,10 +1541,10 @@ class KITData(object):
             list or array of x dataset
 
         """
-        if asarray:
-            return np.asarray(self.__x)
+        if asarray or self.__columnar:
+            return np.asarray(self.__getColumn("x"))
         else:
-            return self.__x
+            return self.__getColumn("x")
 
 
     def getY(self,  asarray=False):
@@ -664,10 +1559,10 @@ class KITData(object):
 
         """
 
-        if asarray:
-            return np.asarray(self.__y)
+        if asarray or self.__columnar:
+            return np.asarray(self.__getColumn("y"))
         else:
-            return self.__y
+            return self.__getColumn("y")
 
     def getZ(self, asarray=False):
         """Returns z dataset as list or array
@@ -681,10 +1576,10 @@ class KITData(object):
 
         """
 
-        if asarray:
-            return np.asarray(self.__z)
+        if asarray or self.__columnar:
+            return np.asarray(self.__getColumn("z"))
         else:
-            return self.__z
+            return self.__getColumn("z")
 
     def getSeed(self):
         """Returns dx dataset as list or array
@@ -737,10 +1632,10 @@ class KITData(object):
             list or array of dy dataset
 
         """
-        if asarray:
-            return np.asarray(self.__dx)
+        if asarray or self.__columnar:
+            return np.asarray(self.__getColumn("dx"))
         else:
-            return self.__dx
+            return self.__getColumn("dx")
 
 
     def getdY(self, asarray=False):
@@ -754,10 +1649,10 @@ class KITData(object):
             list or array of dy dataset
 
         """
-        if asarray:
-            return np.asarray(self.__dy)
+        if asarray or self.__columnar:
+            return np.asarray(self.__getColumn("dy"))
         else:
-            return self.__dy
+            return self.__getColumn("dy")
 
 
     def getdZ(self, asarray=False):
@@ -771,10 +1666,10 @@ class KITData(object):
             list or array of dy dataset
 
         """
-        if asarray:
-            return np.asarray(self.__dz)
+        if asarray or self.__columnar:
+            return np.asarray(self.__getColumn("dz"))
         else:
-            return self.__dz
+            return self.__getColumn("dz")
 
 
     def getSize(self):
@@ -785,7 +1680,8 @@ class KITData(object):
 
         """
 
-        return len(self.__x)
+        # Logs from files may not contain x and y at all
+        return max(len(self.__getColumn(col)) for col in self.__columns)
 
 
     def getName(self):
@@ -874,11 +1770,11 @@ class KITData(object):
 
         """
 
-        return min(self.__x), max(self.__x)
+        return self.stats("x")["min"], self.stats("x")["max"]
 
     def getScaleY(self):
 
-        return 0, 1.3*max(__y)
+        return 0, 1.3*self.stats("y")["max"]
 
     def getProject(self):
         return self.__project
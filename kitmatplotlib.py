@@ -130,26 +130,26 @@ class KITMatplotlib(object):
                 # self.__files.append(arg)
                 # toggle absolute mode
                 if self.absX:
-                    x = list(np.absolute(arg.getX()))
+                    x = arg.derive("x", "abs")
                 else:
                     x = arg.getX()
                 if self.absY:
-                    y = list(np.absolute(arg.getY()))
+                    y = arg.derive("y", "abs")
                 else:
                     y = arg.getY()
                 # get error bars if present
-                if arg.getdX() != [] and arg.getdY() != []:
+                if len(arg.getdX()) != 0 and len(arg.getdY()) != 0:
                     dx = arg.getdX()
                     dy = arg.getdY()
-                elif arg.getdX() == [] and arg.getdY() == []:
+                elif len(arg.getdX()) == 0 and len(arg.getdY()) == 0:
                     pass
                 else:
                     raise ValueError("Check data table. Only 2 (x,y) or "
                                      "4 (x,y,dx,dy) coordinates are allowed.")
                 # create graph list
-                if dx == [] and dy == []:
+                if len(dx) == 0 and len(dy) == 0:
                     self.__graphs.append([x, y])
-                elif dx != [] and dy != []:
+                elif len(dx) != 0 and len(dy) != 0:
                     self.__graphs.append([x, y, dx, dy])
                 else:
                     raise ValueError("z-error not implemented yet")
@@ -220,7 +220,13 @@ class KITMatplotlib(object):
 
 
         # apply user defined normalization or manipulation of y values of each graph
-        kitutils.manipulate(self.__graphs, self.norm)
+        # (KITData objects provide cached results if graphs were not split)
+        if self.splitGraph is not True and \
+           all(isinstance(dset, KITData) for dset in fileList):
+            steps = ("abs",) if self.absY else ()
+            kitutils.manipulate(self.__graphs, self.norm, fileList, steps)
+        else:
+            kitutils.manipulate(self.__graphs, self.norm)
 
         # create an empty canvas with canvas size in [inch]: 1 inch = 2.54 cm
         fig = plt.figure(figsize=list(map(lambda x: x/2.54, self.canvasSize)))
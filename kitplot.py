@@ -388,7 +388,7 @@ class KITPlot(object):
     ### Graph methods ###
     #####################
 
-    def addFiles(self, dataInput=None, measurement="probe"):
+    def addFiles(self, dataInput=None, measurement="probe", cache=True):
         """ Depending on the type, the 'self.__files' list is filled with
         KITData objects. An integer represents a single probe ID. A string
         represents a .txt file or a folder path.
@@ -400,6 +400,8 @@ class KITPlot(object):
                 is filled.
             measurement(str): probe station and ALiBaVa measurements must be
                 handled differently due to different database paramters
+            cache(True|False): Files in a folder are parsed once and then
+                loaded from a binary cache as long as they are unchanged
         """
 
         #TODO: handle multiple KITPlot objects to create canvas with multiple subplots
@@ -448,12 +450,12 @@ class KITPlot(object):
                     self.__files = []
                     for i, bias in enumerate(kdict):
                         # create an empty KITData object
-                        kdata = KITData()
+                        kdata = KITData(columnar=True)
                         # extract each single bias value from the dictionary
                         # and create KITData files for every value
-                        x, y = zip(*kdict[bias])
-                        kdata.setX(list(x))
-                        kdata.setY(list(y))
+                        x, y = kdict[bias]
+                        kdata.setX(x)
+                        kdata.setY(y)
                         kdata.setName(str(bias) + " V")
                         kdata.setPX("Voltage")
                         kdata.setPY("Rpunch")
@@ -468,8 +470,9 @@ class KITPlot(object):
             elif os.path.isdir(dataInput):
                 print("Input interpreted as folder with files")
                 for inputFile in os.listdir(dataInput):
-                    if (os.path.splitext(inputFile)[1] == ".txt"):
-                        self.__files.append(KITData(dataInput + inputFile))
+                    if (os.path.splitext(inputFile)[1] in [".txt", ".kit"]):
+                        self.__files.append(KITData(dataInput + inputFile,
+                                                    cache=cache))
                     else:
                         pass
 
@@ -477,19 +480,27 @@ class KITPlot(object):
             # Load file
             elif os.path.isfile(dataInput):
 
+                # binary KITData archive
+                if os.path.splitext(dataInput)[1] == ".kit":
+                    print("Input interpreted as KITData archive")
+                    self.__files.append(KITData(dataInput))
+
                 # multiple PIDs
-                if self.checkPID(dataInput) == True:
+                elif self.checkPID(dataInput) == True:
                     print("Input interpreted as multiple PIDs")
                     with open(dataInput) as inputFile:
-                        fileList = []
+                        pids = []
                         for line in inputFile:
                             entry = line.split()
                             if entry[0].isdigit():
-                                fileList.append(KITData(entry[0],measurement))
+                                pids.append(entry[0])
 
-                        if measurement is "probe":
-                            self.__files = fileList
+                        # probe station PIDs are fetched in bulk
+                        if measurement == "probe":
+                            self.__files = KITData.fromPIDs(pids)
                         elif measurement == "alibava":
+                            fileList = [KITData(pid,measurement)
+                                        for pid in pids]
                             self.__files.append(KITData(fileList))
 
 
@@ -618,26 +629,9 @@ class KITPlot(object):
 
     def getRDict(self, kdata):
 
-        dic = OrderedDict()
-        bias = kdata.getX()[0]
-        ix = []
-        iy = []
-
         # Rpunch Ramps: x = V_bias, y = V_edge, z = I_edge
-        for (valX, valY, valZ) in zip(kdata.getX(), kdata.getY(), kdata.getZ()):
-            # create the IV keys for one bias voltage
-            if bias == valX:
-                ix.append(valY)
-                iy.append(valZ)
-            else:
-                dic[bias] = zip(ix,iy)
-                bias = valX
-                ix = [valY]
-                iy = [valZ]
-
-        dic[bias] = zip(ix,iy)
-
-        self.__RDict = dic
+        self.__RDict = kitutils.splitRamp(kdata.getX(), kdata.getY(),
+                                          kdata.getZ())
 
         return self.__RDict
 
@@ -677,6 +671,9 @@ class KITPlot(object):
                 else:
                     return False
 
+    def getFiles(self):
+        return self.__files
+
     def getCanvas(self):
         return self.canvas
 